@@ -1,27 +1,87 @@
 # app.py
 
 import streamlit as st
-import numpy as np
-from knowledge_base import SYMPTOMS, INTERVENTIONS
 from inference_engine import InferenceEngine
-from fuzzy_engine import create_fuzzy_control_system, calculate_concern_level
+from fuzzy_engine import load_concern_system, calculate_concern_level
+from result_cache import ResultCache, analysis_version
+from knowledge_store import current_knowledge_base
+from sensitivity import explore
 
-def initialize_session_state():
+@st.cache_resource
+def get_concern_system():
+    """One immutable, thread-safe fuzzy concern evaluator shared by every session in the process."""
+    return load_concern_system()
+
+@st.cache_resource
+def get_result_cache():
+    """Results shared across sessions; identical slider vectors and histories are only analyzed once."""
+    return ResultCache()
+
+def initialize_session_state(kb):
     """Initializes all necessary variables in Streamlit's session state."""
     if 'symptom_inputs' not in st.session_state:
-        st.session_state.symptom_inputs = {symptom_id: 0 for symptom_id in SYMPTOMS.keys()}
+        st.session_state.symptom_inputs = {symptom_id: 0 for symptom_id in kb.symptoms.keys()}
     if 'results' not in st.session_state:
         st.session_state.results = None
-    if 'fuzzy_system' not in st.session_state:
-        st.session_state.fuzzy_system = create_fuzzy_control_system()
     if 'suggestion_history' not in st.session_state:
         st.session_state.suggestion_history = []
+    if 'engine' not in st.session_state:
+        # Incremental engine kept across reruns: moving one slider only re-evaluates the rules that use it
+        st.session_state.engine = InferenceEngine(kb.network, kb.intervention_index, incremental=True)
+    if 'analyzed_inputs' not in st.session_state:
+        st.session_state.analyzed_inputs = None
+
+def show_sensitivity(kb, engine, symptom_inputs):
+    """Closest slider changes that alter the outcome, and the one-slider decision boundaries."""
+    report = explore(engine, get_concern_system(), symptom_inputs)
+
+    def condition_name(condition_id):
+        return kb.conditions[condition_id]['name'] if condition_id else "No single pattern"
+
+    def describe(changes):
+        return " and ".join(f"**{kb.symptoms[s]}** {symptom_inputs[s]} → {v}" for s, v in changes)
+
+    st.write(
+        f"{report['variants']:,} one- and two-slider variations of your answers were analyzed "
+        f"in {report['seconds'] * 1000:.0f} ms (the safety question is held fixed)."
+    )
+    st.markdown("**Smallest changes that alter the detected pattern:**")
+    if not report['condition_flips']:
+        st.write("No change of one or two answers alters the detected pattern.")
+    for flip in report['condition_flips']:
+        st.markdown(f"- {describe(flip['changes'])}: {condition_name(flip['result'])}")
+
+    st.markdown(f"**Smallest changes that move the concern level out of '{report['baseline']['band']}':**")
+    if not report['band_flips']:
+        st.write("No change of one or two answers moves the concern level to another band.")
+    for flip in report['band_flips']:
+        st.markdown(f"- {describe(flip['changes'])}: {flip['result']['band']} ({flip['result']['concern']:.2f})")
+
+    if report['boundaries']:
+        st.markdown("**Decision boundaries for single answers:**")
+        st.dataframe([
+            {
+                "Question": kb.symptoms[b['symptom']],
+                "Between": f"{b['between'][0]} and {b['between'][1]}",
+                "Pattern": " → ".join(condition_name(c) for c in b['condition']) if b['condition'][0] != b['condition'][1] else "",
+                "Concern": " → ".join(b['band']) if b['band'][0] != b['band'][1] else "",
+            }
+            for b in report['boundaries']
+        ], hide_index=True)
 
 def main():
     """The main function that runs the Streamlit application."""
     st.set_page_config(page_title="Mindful AI Advisor", page_icon="🧠", layout="wide")
-    initialize_session_state()
-    engine = InferenceEngine()
+    kb = current_knowledge_base()
+    initialize_session_state(kb)
+    if st.session_state.engine.network is not kb.network:
+        # The knowledge base was reloaded: start a fresh engine and keep the answers that still apply.
+        # Results came from the old knowledge base, so they are dropped until the next analysis.
+        st.session_state.engine = InferenceEngine(kb.network, kb.intervention_index, incremental=True)
+        st.session_state.symptom_inputs = {s: st.session_state.symptom_inputs.get(s, 0) for s in kb.symptoms}
+        st.session_state.analyzed_inputs = None
+        st.session_state.results = None
+    engine = st.session_state.engine
 
     st.title("🧠 Mindful AI Advisor")
     st.markdown("This is an educational tool. It is **not** a substitute for professional medical advice.")
@@ -31,31 +91,40 @@ def main():
         st.markdown("Over the last two weeks, rate each from 0 (Not at all) to 10 (Constantly).")
         
         # Create sliders for all symptoms, with the safety question last
-        symptom_keys = list(SYMPTOMS.keys())
+        symptom_keys = list(kb.symptoms.keys())
         safety_key = "thoughts_of_harm"
         symptom_keys.remove(safety_key)
         
         for symptom_id in symptom_keys:
             st.session_state.symptom_inputs[symptom_id] = st.slider(
-                SYMPTOMS[symptom_id], 0, 10, st.session_state.symptom_inputs[symptom_id], key=symptom_id
+                kb.symptoms[symptom_id], 0, 10, st.session_state.symptom_inputs[symptom_id], key=symptom_id
             )
         
         st.markdown("---")
         st.session_state.symptom_inputs[safety_key] = st.slider(
-            f"**{SYMPTOMS[safety_key]}**", 0, 10, st.session_state.symptom_inputs[safety_key], key=safety_key
+            f"**{kb.symptoms[safety_key]}**", 0, 10, st.session_state.symptom_inputs[safety_key], key=safety_key
         )
 
+        auto_analyze = st.checkbox("Auto-analyze on change", key="auto_analyze")
         analyze_button = st.button("Analyze My Responses", type="primary")
         if st.button("Reset"):
             st.session_state.clear()
             st.rerun()
 
-    if analyze_button:
-        for symptom_id, value in st.session_state.symptom_inputs.items():
-            engine.add_fact(symptom_id, value)
-        
-        conditions, interventions, log = engine.run(st.session_state.suggestion_history)
-        concern_level = calculate_concern_level(st.session_state.fuzzy_system, st.session_state.symptom_inputs)
+    for symptom_id, value in st.session_state.symptom_inputs.items():
+        engine.add_fact(symptom_id, value)
+
+    inputs_changed = st.session_state.analyzed_inputs != st.session_state.symptom_inputs
+    if analyze_button or (auto_analyze and inputs_changed):
+        def analyze():
+            conditions, interventions, log = engine.run(st.session_state.suggestion_history)
+            concern_level = calculate_concern_level(get_concern_system(), st.session_state.symptom_inputs)
+            return conditions, interventions, log, concern_level
+
+        conditions, interventions, log, concern_level = get_result_cache().get_or_compute(
+            st.session_state.symptom_inputs, st.session_state.suggestion_history, analysis_version(engine), analyze,
+            engine.network.symptom_ids
+        )
         
         st.session_state.results = {
             "conditions": conditions,
@@ -63,8 +132,11 @@ def main():
             "log": log,
             "concern": concern_level
         }
+        st.session_state.analyzed_inputs = dict(st.session_state.symptom_inputs)
         # Update history to prevent future repetition in this session
-        st.session_state.suggestion_history.extend(interventions.keys())
+        # (auto-analyze previews results without rotating the suggestions)
+        if analyze_button:
+            st.session_state.suggestion_history.extend(interventions.keys())
 
     if st.session_state.results:
         results = st.session_state.results
@@ -78,7 +150,7 @@ def main():
                 "Your well-being is the most important thing, and we strongly urge you to seek immediate support."
             )
             st.subheader("Recommended Action:")
-            st.warning(INTERVENTIONS['Seek Immediate Help']['description'])
+            st.warning(results['interventions']['Seek Immediate Help']['description'])
             st.markdown("---")
             st.markdown(
                 "Other resources: "
@@ -114,7 +186,10 @@ def main():
             with st.expander("Show Explanation Log (XAI)"):
                 st.write("This log shows the inference engine's reasoning process.")
                 for entry in results['log']:
-                    st.code(entry, language='text')
+                    st.code(str(entry), language='text')
+
+            with st.expander("What-if Sensitivity"):
+                show_sensitivity(kb, engine, st.session_state.analyzed_inputs)
     else:
         st.info("Please adjust the sliders in the sidebar and click 'Analyze My Responses' to see your results.")
 
@@ -0,0 +1,280 @@
+# assessment_store.py
+
+"""
+Append-only columnar store of scored assessments.
+
+A store is a directory with one file per column plus a manifest:
+
+    symptom.<id>.u8     uint8 slider value (0-10) for each SYMPTOMS key
+    condition.u8        detected condition as 1 + position in the manifest's
+                        condition list, 0 when no pattern was detected
+    concern.f4          float32 fuzzy concern score
+    interventions.u64   suggested interventions as bitmask words over the
+                        manifest's intervention list (64 per word)
+    manifest.json       schema and the number of committed rows
+
+Columns are read as memory-mapped NumPy arrays, so analytics over millions
+of rows only keep the pages they are scanning resident. Appends write every
+column first and then replace the manifest, which is the commit point:
+readers never see a partial row, and bytes left behind by an interrupted
+append are truncated the next time the store is opened for writing.
+
+The schema (symptoms, conditions, interventions) is fixed when the store is
+created, from the knowledge base served at that time.
+
+Usage:
+    python assessment_store.py import dump.csv assessments/ --chunk-size 100000
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+import numpy as np
+from inference_engine import InferenceEngine
+from fuzzy_engine import CONCERN_INPUTS, load_concern_system
+from knowledge_store import current_knowledge_base
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+
+
+class AssessmentStore:
+    """One store directory; open with `create` or `open`."""
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+        self.symptom_ids = manifest['symptoms']
+        self.conditions = manifest['conditions']
+        self.interventions = manifest['interventions']
+        self.words = -(-len(self.interventions) // 64)
+        self.dtypes = {f"symptom.{s}": np.uint8 for s in self.symptom_ids}
+        self.dtypes['condition'] = np.uint8
+        self.dtypes['concern'] = np.float32
+        self.dtypes['interventions'] = np.uint64
+        self.widths = {name: 1 for name in self.dtypes}
+        self.widths['interventions'] = self.words
+
+    @classmethod
+    def create(cls, path, kb=None):
+        kb = kb or current_knowledge_base()
+        if len(kb.conditions) > 254:
+            raise ValueError("The condition column holds at most 254 conditions.")
+        manifest = {
+            'format': FORMAT_VERSION,
+            'knowledge_base': {
+                'version': kb.version,
+                'fingerprint': kb.fingerprint,
+                'rules': kb.network.fingerprint,
+                'interventions': kb.intervention_index.fingerprint,
+            },
+            'symptoms': list(kb.symptoms),
+            'conditions': list(kb.conditions),
+            'interventions': list(kb.interventions),
+            'rows': 0,
+        }
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, MANIFEST)):
+            raise ValueError(f"{path} already contains an assessment store.")
+        store = cls(path, manifest)
+        for name in store.dtypes:
+            open(store._column_path(name), 'wb').close()
+        store._write_manifest()
+        return store
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported assessment store format: {manifest.get('format')}.")
+        return cls(path, manifest)
+
+    @classmethod
+    def open_or_create(cls, path, kb=None):
+        if os.path.exists(os.path.join(path, MANIFEST)):
+            return cls.open(path)
+        return cls.create(path, kb)
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    def _column_path(self, name):
+        suffix = {np.uint8: 'u8', np.float32: 'f4', np.uint64: 'u64'}[self.dtypes[name]]
+        return os.path.join(self.path, f"{name}.{suffix}")
+
+    def _write_manifest(self):
+        tmp = os.path.join(self.path, MANIFEST + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, MANIFEST))
+
+    # --- Reading ---
+
+    def column(self, name):
+        """Read-only memory map of the committed rows of one column."""
+        rows, width = len(self), self.widths[name]
+        shape = (rows, width) if width > 1 else (rows,)
+        if rows == 0:
+            return np.empty(shape, dtype=self.dtypes[name])
+        return np.memmap(self._column_path(name), dtype=self.dtypes[name], mode='r', shape=shape)
+
+    def symptom_matrix(self, start=0, stop=None):
+        """(rows, symptoms) uint8 slice of the symptom columns."""
+        return np.column_stack([self.column(f"symptom.{s}")[start:stop] for s in self.symptom_ids])
+
+    # --- Appending ---
+
+    def append(self, symptom_matrix, condition_codes, concern, intervention_masks):
+        """Appends already-scored rows; all columns are written before the row count is committed."""
+        symptom_matrix = np.asarray(symptom_matrix)
+        rows = len(symptom_matrix)
+        if rows == 0:
+            return 0
+        if symptom_matrix.shape[1] != len(self.symptom_ids):
+            raise ValueError(f"Expected {len(self.symptom_ids)} symptom columns, got {symptom_matrix.shape[1]}.")
+        if symptom_matrix.min() < 0 or symptom_matrix.max() > 10:
+            raise ValueError("Symptom scores must be between 0 and 10.")
+        # Rounding here would store values other than the ones the rows were scored on
+        if not np.array_equal(symptom_matrix, np.rint(symptom_matrix)):
+            raise ValueError("Symptom scores must be whole slider positions.")
+
+        values = {f"symptom.{s}": symptom_matrix[:, i] for i, s in enumerate(self.symptom_ids)}
+        values['condition'] = condition_codes
+        values['concern'] = concern
+        values['interventions'] = np.asarray(intervention_masks).reshape(rows, self.words)
+
+        committed = len(self)
+        for name, dtype in self.dtypes.items():
+            path = self._column_path(name)
+            with open(path, 'r+b') as f:
+                # Drop anything an interrupted append left past the committed rows
+                f.truncate(committed * self.widths[name] * np.dtype(dtype).itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(values[name], dtype=dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.manifest['rows'] = committed + rows
+        self._write_manifest()
+        return rows
+
+    def check_engine(self, engine):
+        """Raises ValueError unless `engine` runs the knowledge base the store's schema came from."""
+        expected = self.manifest['knowledge_base']
+        actual = {'rules': engine.network.fingerprint, 'interventions': engine.intervention_index.fingerprint}
+        # Manifests without these fingerprints are still covered by the id checks in `append_scored`
+        if any(expected.get(key, value) != value for key, value in actual.items()):
+            raise ValueError(
+                f"The engine's knowledge base differs from version {expected['version']} "
+                f"this store was created with; score it into a new store."
+            )
+
+    def score(self, symptom_matrix, suggestion_history=None, engine=None, concern_system=None):
+        """
+        Scores rows (columns ordered as the store's symptoms) with `run_batch`
+        into `append`'s arguments. Values are rounded to whole slider positions
+        first, so the stored symptoms are exactly the ones that were scored.
+        Raises ValueError if the engine's knowledge base is not the store's,
+        since its results could not be coded faithfully.
+        """
+        symptom_matrix = np.rint(np.asarray(symptom_matrix, dtype=float))
+        if engine is None:
+            kb = current_knowledge_base()
+            engine = InferenceEngine(kb.network, kb.intervention_index)
+        self.check_engine(engine)
+        concern_system = concern_system or load_concern_system()
+
+        # The engine's symptom order may differ from the store's schema
+        position = {s: i for i, s in enumerate(self.symptom_ids)}
+        engine_matrix = np.zeros((len(symptom_matrix), len(engine.network.symptom_ids)), dtype=symptom_matrix.dtype)
+        for i, s in enumerate(engine.network.symptom_ids):
+            if s in position:
+                engine_matrix[:, i] = symptom_matrix[:, position[s]]
+        batch_conditions, batch_interventions = engine.run_batch(engine_matrix, suggestion_history)
+
+        # Code 0 means "no pattern", so an unknown condition must not fall back to it
+        condition_code = {c: i + 1 for i, c in enumerate(self.conditions)}
+        unknown = {c[0]['id'] for c in batch_conditions if c} - condition_code.keys()
+        unknown |= {name for interventions in batch_interventions for name in interventions} - set(self.interventions)
+        if unknown:
+            raise ValueError(f"Not in this store's schema: {', '.join(sorted(unknown))}.")
+        codes = np.array([condition_code[c[0]['id']] if c else 0 for c in batch_conditions], dtype=np.uint8)
+
+        intervention_bit = {name: i for i, name in enumerate(self.interventions)}
+        masks = np.zeros((len(symptom_matrix), self.words), dtype=np.uint64)
+        for row, interventions in enumerate(batch_interventions):
+            for name in interventions:
+                bit = intervention_bit[name]
+                masks[row, bit // 64] |= np.uint64(1 << (bit % 64))
+
+        concern_columns = [position.get(s) for s in CONCERN_INPUTS.values()]
+        concern_inputs = np.column_stack([
+            symptom_matrix[:, c] if c is not None else np.full(len(symptom_matrix), 5) for c in concern_columns
+        ])
+        return symptom_matrix, codes, concern_system.evaluate(concern_inputs), masks
+
+    def append_scored(self, symptom_matrix, suggestion_history=None, engine=None, concern_system=None):
+        """Scores rows with `score` and appends them."""
+        return self.append(*self.score(symptom_matrix, suggestion_history, engine, concern_system))
+
+
+def import_dump(input_path, store_path, input_format=None, chunk_size=100000):
+    """Scores a CSV/JSONL questionnaire dump (see bulk_score.py) into a store."""
+    from bulk_score import detect_format, parse_records, read_chunks, validate_records
+
+    # One snapshot for the whole import, so a reload cannot split it across knowledge bases
+    kb = current_knowledge_base()
+    store = AssessmentStore.open_or_create(store_path, kb)
+    input_format = detect_format(input_path, input_format)
+    engine = InferenceEngine(kb.network, kb.intervention_index)
+    concern_system = load_concern_system()
+    imported = skipped = 0
+
+    with open(input_path, 'rb') as source:
+        header = None
+        if input_format == 'csv':
+            header_line = source.readline()
+            header = next(csv.reader([header_line.decode('utf-8').strip()]))
+        for lines, _ in read_chunks(source, source.tell(), chunk_size):
+            rows, groups = [], {}
+            for _, _, assessment in validate_records(parse_records(lines, input_format, header), store.symptom_ids):
+                if isinstance(assessment, str):
+                    skipped += 1
+                    continue
+                groups.setdefault(tuple(assessment['suggestion_history']), []).append(len(rows))
+                rows.append([assessment['symptoms'][s] for s in store.symptom_ids])
+            if not rows:
+                continue
+
+            # run_batch takes one history per call; the groups are put back in input order
+            # and committed with a single append, so a chunk costs one round of fsyncs
+            matrix, order, parts = np.array(rows), [], []
+            for history, indexes in groups.items():
+                parts.append(store.score(matrix[indexes], list(history), engine, concern_system))
+                order.extend(indexes)
+            inverse = np.argsort(order)
+            imported += store.append(*[np.concatenate(column)[inverse] for column in zip(*parts)])
+            print(f"{imported:,} assessments imported, {skipped:,} skipped", file=sys.stderr)
+    return imported
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the columnar assessment store.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    importer = subparsers.add_parser('import', help="Score a CSV/JSONL dump into a store.")
+    importer.add_argument('input')
+    importer.add_argument('store')
+    importer.add_argument('--input-format', choices=['csv', 'jsonl'])
+    importer.add_argument('--chunk-size', type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        import_dump(args.input, args.store, args.input_format, args.chunk_size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+# benchmarks.py
+
+"""
+Reproducible performance benchmarks for the advisor.
+
+Covers InferenceEngine.run on random and adversarial symptom vectors (real
+and synthetic knowledge bases), intervention ranking over synthetic
+libraries from 10 to 100k entries, concern scoring (single and batched),
+the analytic fuzzy evaluator with rule bases over all symptoms, fuzzy system
+build time, and import / cold start of app.py.
+
+Results are written as JSON. With --compare, each result is checked against
+a stored baseline and anything slower by more than --tolerance is reported
+as a regression (non-zero exit status).
+
+Usage:
+    python benchmarks.py --output bench.json
+    python benchmarks.py --output new.json --compare bench.json --tolerance 0.25
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+from knowledge_base import SYMPTOMS
+from mamdani import MamdaniSystem
+from inference_engine import InferenceEngine, InterventionIndex, RuleNetwork, SYMPTOM_IDS
+import fuzzy_engine
+from result_cache import ResultCache, analysis_version
+
+SEED = 1234
+
+
+# --- Timing ---
+
+def measure(fn, repeat=5, number=None, min_time=0.05):
+    """Per-call seconds for `fn` (best and median over `repeat` rounds of `number` calls)."""
+    if number is None:
+        number, elapsed = 1, 0.0
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time or number >= 1_000_000:
+                break
+            number *= 10
+
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number)
+    return {'best': min(rounds), 'median': statistics.median(rounds), 'calls': number}
+
+
+# --- Synthetic Knowledge Base Generators ---
+
+def make_symptoms(count):
+    """Symptom ids for a synthetic knowledge base; always includes the safety symptom."""
+    return {f"symptom_{i}": "" for i in range(count - 1)} | {'thoughts_of_harm': ""}
+
+def make_conditions(count, symptom_ids, rng):
+    ids = [s for s in symptom_ids if s != 'thoughts_of_harm']
+    conditions = {}
+    for i in range(count):
+        chosen = rng.sample(ids, min(len(ids), rng.randint(2, 6)))
+        split = rng.randint(1, len(chosen) - 1)
+        conditions[f"Condition{i}"] = {
+            'name': f"Synthetic Condition {i}",
+            'priority': rng.choice([5, 10]),
+            'core_symptoms': chosen[:split],
+            'other_symptoms': chosen[split:],
+            'core_policy': rng.choice(['any', 'all']),
+            'threshold': rng.randint(1, len(chosen)),
+            'explanation': "",
+        }
+    return conditions
+
+def make_interventions(count, symptom_ids, rng):
+    interventions = {'Seek Immediate Help': {'modality': 'Crisis Support', 'target': ['thoughts_of_harm'], 'description': ""}}
+    ids = [s for s in symptom_ids if s != 'thoughts_of_harm']
+    for i in range(count):
+        interventions[f"Intervention {i}"] = {
+            'modality': rng.choice(['CBT', 'Mindfulness', 'Behavioral']),
+            'target': rng.sample(ids, rng.randint(1, min(4, len(ids)))),
+            'description': "",
+        }
+    return interventions
+
+def make_fuzzy_rules(count, variables, rng):
+    """Mamdani rules over low/medium/high terms of `variables`, one to three antecedents each."""
+    return [
+        (rng.choice(['and', 'or']),
+         [(v, rng.choice(['low', 'medium', 'high'])) for v in rng.sample(variables, rng.randint(1, 3))],
+         rng.choice(['low', 'moderate', 'high']))
+        for _ in range(count)
+    ]
+
+def symptom_vectors(kind, count, symptom_ids, rng):
+    """Random and adversarial fact dicts for InferenceEngine.run."""
+    vectors = []
+    for _ in range(count):
+        if kind == 'random':
+            values = [rng.randint(0, 10) for _ in symptom_ids]
+        elif kind == 'boundary':
+            # Every score sits on the >=5 threshold, flipping many partial matches
+            values = [rng.choice([4, 5]) for _ in symptom_ids]
+        else:  # 'all_present': every rule is a candidate and must be scored
+            values = [10 for _ in symptom_ids]
+        vector = dict(zip(symptom_ids, values))
+        vector['thoughts_of_harm'] = 0
+        vectors.append(vector)
+    return vectors
+
+
+# --- Benchmarks ---
+
+def _run_engine(vectors, network=None, intervention_index=None):
+    cycle = iter(())
+    def step():
+        nonlocal cycle
+        facts = next(cycle, None)
+        if facts is None:
+            cycle = iter(vectors)
+            facts = next(cycle)
+        engine = InferenceEngine(network, intervention_index)
+        engine.facts = dict(facts)
+        engine.run()
+    return step
+
+def bench_inference(results, quick):
+    rng = random.Random(SEED)
+    for kind in ['random', 'boundary', 'all_present']:
+        vectors = symptom_vectors(kind, 200, SYMPTOM_IDS, rng)
+        results[f"inference.run.{kind}"] = measure(_run_engine(vectors))
+
+    matrix = np.random.default_rng(SEED).integers(0, 11, (2000 if quick else 20000, len(SYMPTOM_IDS)))
+    batch = measure(lambda: InferenceEngine().run_batch(matrix), repeat=3, number=1)
+    results['inference.run_batch.per_row'] = {k: v / len(matrix) if k != 'calls' else v for k, v in batch.items()}
+
+    # Scaling with the number of rules on synthetic knowledge bases
+    for rule_count in ([10, 100, 1000] if quick else [10, 100, 1000, 5000]):
+        symptoms = make_symptoms(60)
+        ids = list(symptoms)
+        network = RuleNetwork(symptoms, make_conditions(rule_count, ids, rng))
+        index = InterventionIndex(make_interventions(50, ids, rng), ids)
+        vectors = symptom_vectors('random', 200, ids, rng)
+        results[f"inference.run.synthetic_rules.{rule_count}"] = measure(_run_engine(vectors, network, index))
+
+def bench_interventions(results, quick):
+    rng = random.Random(SEED)
+    ids = list(make_symptoms(60))
+    sizes = [10, 100, 1000, 10000] if quick else [10, 100, 1000, 10000, 100000]
+    for size in sizes:
+        index = InterventionIndex(make_interventions(size, ids, rng), ids)
+        engine = InferenceEngine(intervention_index=index)
+        symptom_sets = [set(rng.sample(ids, 5)) for _ in range(50)]
+        histories = [rng.sample(index.names, min(len(index.names), 10)) for _ in range(50)]
+        pairs = list(zip(symptom_sets, histories))
+        position = [0]
+        def step():
+            symptoms, history = pairs[position[0] % len(pairs)]
+            position[0] += 1
+            engine._get_interventions(symptoms, history)
+        results[f"interventions.top_k.library.{size}"] = measure(step)
+
+def bench_concern(results, quick):
+    rng = np.random.default_rng(SEED)
+    simulation = fuzzy_engine.create_fuzzy_control_system()
+    simulation.cache = False  # otherwise repeated inputs are answered from skfuzzy's own cache
+    compiled = fuzzy_engine.compile_concern_system()
+    inputs = [dict(zip(fuzzy_engine.CONCERN_INPUTS.values(), map(int, row))) for row in rng.integers(0, 11, (100, 3))]
+
+    position = [0]
+    def single(system):
+        def step():
+            position[0] += 1
+            fuzzy_engine.calculate_concern_level(system, inputs[position[0] % len(inputs)])
+        return step
+    with contextlib.redirect_stdout(io.StringIO()):  # silence "Fuzzy calculation error" fallbacks
+        results['concern.single.skfuzzy'] = measure(single(simulation), repeat=3)
+    results['concern.single.compiled'] = measure(single(compiled))
+    results['concern.single.analytic'] = measure(single(fuzzy_engine.create_analytic_concern_system()))
+
+    for size in [1000, 100000]:
+        integer_rows = rng.integers(0, 11, (size, 3))
+        float_rows = rng.uniform(0, 10, (size, 3))
+        results[f"concern.batch.integer.{size}"] = measure(lambda: compiled.evaluate(integer_rows), repeat=3, number=1)
+        results[f"concern.batch.float.{size}"] = measure(lambda: compiled.evaluate(float_rows), repeat=3, number=1)
+
+def bench_fuzzy_build(results, quick):
+    results['fuzzy.build.skfuzzy'] = measure(fuzzy_engine.create_fuzzy_control_system, repeat=3)
+    results['fuzzy.build.compiled'] = measure(fuzzy_engine.compile_concern_system, repeat=3)
+
+def bench_fuzzy_rules(results, quick):
+    """The analytic evaluator with a rule base over every symptom."""
+    rng = random.Random(SEED)
+    terms = fuzzy_engine.MEMBERSHIP_FUNCTIONS['mood']
+    variables = list(SYMPTOMS)
+    for count in [13, 130] if quick else [13, 130, 1300]:
+        system = MamdaniSystem({v: terms for v in variables}, fuzzy_engine.MEMBERSHIP_FUNCTIONS['concern'],
+                               make_fuzzy_rules(count, variables, rng))
+        rows = np.random.default_rng(SEED).uniform(0, 10, (10000, len(variables)))
+        assessments = [dict(zip(variables, row)) for row in rows[:100]]
+        position = [0]
+        def step():
+            position[0] += 1
+            system.compute(assessments[position[0] % len(assessments)])
+        results[f"fuzzy_rules.{count}.single"] = measure(step)
+        results[f"fuzzy_rules.{count}.batch.10000"] = measure(lambda: system.evaluate(rows), repeat=3, number=1)
+
+def replayed_workload(count, rng, pool_size=2000):
+    """
+    Realistic request stream: symptom vectors drawn Zipf-style from a pool
+    (popular answer patterns repeat often), and most users on their first
+    analysis with an empty suggestion history.
+    """
+    pool = [[min(10, max(0, int(rng.gauss(mu, 2)))) for mu in rng.choices([1, 3, 6, 8], k=len(SYMPTOM_IDS))]
+            for _ in range(pool_size)]
+    weights = [1 / (rank + 1) for rank in range(pool_size)]
+    histories = [[], [], [], ['Mindful Breathing', 'Cognitive Reframing', 'Worry Postponement']]
+    requests = []
+    for vector in rng.choices(pool, weights=weights, k=count):
+        facts = dict(zip(SYMPTOM_IDS, vector))
+        facts['thoughts_of_harm'] = 0
+        requests.append((facts, rng.choice(histories)))
+    return requests
+
+def bench_result_cache(results, quick):
+    rng = random.Random(SEED)
+    requests = replayed_workload(5000 if quick else 50000, rng)
+    concern_system = fuzzy_engine.compile_concern_system()
+    version = analysis_version(InferenceEngine())
+
+    def analyze(facts, history):
+        engine = InferenceEngine()
+        for symptom_id, value in facts.items():
+            engine.add_fact(symptom_id, value)
+        conditions, interventions, log = engine.run(history)
+        return conditions, interventions, log, fuzzy_engine.calculate_concern_level(concern_system, facts)
+
+    start = time.perf_counter()
+    for facts, history in requests:
+        analyze(facts, history)
+    uncached = (time.perf_counter() - start) / len(requests)
+
+    cache = ResultCache(max_entries=1000)
+    start = time.perf_counter()
+    for facts, history in requests:
+        cache.get_or_compute(facts, history, version, lambda: analyze(facts, history))
+    cached = (time.perf_counter() - start) / len(requests)
+
+    results['result_cache.replay.uncached'] = {'best': uncached, 'median': uncached, 'calls': len(requests)}
+    results['result_cache.replay.cached'] = {'best': cached, 'median': cached, 'calls': len(requests), **cache.stats()}
+
+def _subprocess_seconds(code):
+    """Wall time of a fresh interpreter running `code`, or None if it fails."""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               capture_output=True)
+    elapsed = time.perf_counter() - start
+    return elapsed if completed.returncode == 0 else None
+
+def bench_cold_start(results, quick):
+    rounds = 2 if quick else 5
+    baseline = [_subprocess_seconds("pass") for _ in range(rounds)]
+    imports = [_subprocess_seconds("import app") for _ in range(rounds)]
+    if None in imports:
+        results['app.import'] = {'skipped': "app.py could not be imported (is streamlit installed?)"}
+    else:
+        results['app.import'] = {'best': min(imports) - min(baseline), 'median': statistics.median(imports) - min(baseline), 'calls': 1}
+
+    apptest = (
+        "from streamlit.testing.v1 import AppTest\n"
+        "at = AppTest.from_file('app.py', default_timeout=60).run()\n"
+        "assert not at.exception\n"
+    )
+    cold = [_subprocess_seconds(apptest) for _ in range(rounds)]
+    if None in cold:
+        results['app.cold_start'] = {'skipped': "streamlit.testing AppTest run failed or is unavailable"}
+    else:
+        results['app.cold_start'] = {'best': min(cold) - min(baseline), 'median': statistics.median(cold) - min(baseline), 'calls': 1}
+
+BENCHMARKS = {
+    'inference': bench_inference,
+    'interventions': bench_interventions,
+    'concern': bench_concern,
+    'fuzzy_build': bench_fuzzy_build,
+    'fuzzy_rules': bench_fuzzy_rules,
+    'cold_start': bench_cold_start,
+    'result_cache': bench_result_cache,
+}
+
+
+# --- Reporting ---
+
+def compare(results, baseline, tolerance):
+    """Names of benchmarks whose best time regressed by more than `tolerance` (a fraction)."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or 'best' not in previous or 'best' not in current:
+            continue
+        ratio = current['best'] / previous['best'] if previous['best'] > 0 else 1.0
+        flag = 'REGRESSION' if ratio > 1 + tolerance else ''
+        print(f"{name:45s} {previous['best'] * 1e6:12.1f}us -> {current['best'] * 1e6:12.1f}us  x{ratio:5.2f} {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the advisor's performance benchmarks.")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS), help="Run a subset of benchmark groups.")
+    parser.add_argument('--quick', action='store_true', help="Smaller sizes for a fast smoke run.")
+    parser.add_argument('--compare', help="Baseline results file to check for regressions.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown before flagging (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        started = time.perf_counter()
+        BENCHMARKS[name](results, args.quick)
+        print(f"[{name}] done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'quick': args.quick,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("No regressions.")
+
+if __name__ == "__main__":
+    main()
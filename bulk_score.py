@@ -0,0 +1,296 @@
+# bulk_score.py
+
+"""
+Streaming bulk scoring of exported questionnaire dumps.
+
+Records flow through a generator pipeline: raw lines are read in chunks,
+and each chunk is parsed, validated against the served symptoms, scored with the
+InferenceEngine and the compiled concern system, and serialized inside a
+worker process. Chunks are written back in input order with a bounded
+number in flight, so memory stays flat regardless of file size.
+
+Input formats:
+    CSV   header row of symptom ids, optional 'id' and 'suggestion_history'
+          (';'-separated) columns; one record per line.
+    JSONL one object per line, either {"symptoms": {...}, ...} or flat
+          symptom keys, with optional 'id' and 'suggestion_history'.
+
+After every written chunk the input and output byte offsets are saved to a
+checkpoint file. --resume truncates the output back to the last checkpoint
+and continues reading the input from there, so no record is lost or written
+twice after a crash.
+
+The knowledge base is pinned when scoring starts: every output row carries its
+version, and a worker that sees a different knowledge base (after a reload)
+fails the run rather than mixing results. The checkpoint records the pinned
+fingerprint, so --resume refuses to continue under another knowledge base.
+
+Usage:
+    python bulk_score.py dump.csv scores.jsonl --workers 8 --log --resume
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from inference_engine import InferenceEngine
+from fuzzy_engine import load_concern_system
+from knowledge_store import current_knowledge_base
+from scoring_service import RequestError, validate_assessment
+
+CSV_FIELDS = ['offset', 'id', 'condition', 'match', 'interventions', 'concern', 'kb_version', 'error', 'log']
+
+# --- Worker Process State ---
+_worker_fuzzy_system = None
+
+def _init_worker():
+    global _worker_fuzzy_system
+    _worker_fuzzy_system = load_concern_system()
+
+
+# --- Pipeline Stages (run inside workers) ---
+
+def parse_records(lines, input_format, header):
+    """Yields (offset, record id, raw assessment or error message) for each raw line."""
+    for offset, line in lines:
+        text = line.decode('utf-8').strip()
+        if not text:
+            continue
+        try:
+            if input_format == 'csv':
+                values = next(csv.reader([text]))
+                if len(values) != len(header):
+                    raise RequestError(f"Expected {len(header)} columns, got {len(values)}.")
+                fields = dict(zip(header, values))
+                record_id = fields.pop('id', None)
+                history = fields.pop('suggestion_history', '')
+                payload = {
+                    'symptoms': {k: float(v) if '.' in v else int(v) for k, v in fields.items() if v != ''},
+                    'suggestion_history': [h for h in history.split(';') if h],
+                }
+            else:
+                obj = json.loads(text)
+                if not isinstance(obj, dict):
+                    raise RequestError("Each JSONL record must be an object.")
+                record_id = obj.get('id')
+                payload = obj if 'symptoms' in obj else {
+                    'symptoms': {k: v for k, v in obj.items() if k not in ('id', 'suggestion_history')},
+                    'suggestion_history': obj.get('suggestion_history', []),
+                }
+            yield offset, record_id, payload
+        except (ValueError, RequestError) as e:
+            yield offset, None, f"Unparseable record: {e}"
+
+def validate_records(records, known_symptoms):
+    """Yields (offset, record id, normalized assessment or error message)."""
+    for offset, record_id, payload in records:
+        if isinstance(payload, str):
+            yield offset, record_id, payload
+            continue
+        try:
+            yield offset, record_id, validate_assessment(payload, known_symptoms)
+        except RequestError as e:
+            yield offset, record_id, str(e)
+
+def score_records(records, include_log, kb):
+    """Scores a chunk of validated records; rows without a log request go through `run_batch`."""
+    records = list(records)
+    valid = [(i, r[2]) for i, r in enumerate(records) if not isinstance(r[2], str)]
+    results = [None] * len(records)
+    if not valid:
+        return records, results
+
+    concern = _worker_fuzzy_system.evaluate([a['concern_inputs'] for _, a in valid])
+
+    if include_log:
+        for (i, assessment), concern_level in zip(valid, concern):
+            engine = InferenceEngine(kb.network, kb.intervention_index)
+            for symptom_id, value in assessment['symptoms'].items():
+                engine.add_fact(symptom_id, value)
+            conditions, interventions, log = engine.run(assessment['suggestion_history'])
+            results[i] = (conditions, interventions, log, float(concern_level))
+        return records, results
+
+    # Group rows sharing a suggestion history so each group is one vectorized call
+    groups = {}
+    for (i, assessment), concern_level in zip(valid, concern):
+        groups.setdefault(tuple(assessment['suggestion_history']), []).append((i, assessment, concern_level))
+    engine = InferenceEngine(kb.network, kb.intervention_index)
+    for history, rows in groups.items():
+        matrix = np.array([[a['symptoms'][s] for s in kb.network.symptom_ids] for _, a, _ in rows])
+        batch_conditions, batch_interventions = engine.run_batch(matrix, list(history))
+        for (i, _, concern_level), conditions, interventions in zip(rows, batch_conditions, batch_interventions):
+            results[i] = (conditions, interventions, None, float(concern_level))
+    return records, results
+
+def serialize_records(records, results, output_format, kb_version):
+    """Renders scored records as one text block in the output format."""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, CSV_FIELDS, lineterminator='\n') if output_format == 'csv' else None
+    for (offset, record_id, assessment), result in zip(records, results):
+        row = {'offset': offset, 'id': record_id, 'kb_version': kb_version}
+        if result is None:
+            row['error'] = assessment
+        else:
+            conditions, interventions, log, concern = result
+            row['condition'] = conditions[0]['id'] if conditions else None
+            row['match'] = conditions[0].get('match') if conditions else None
+            row['interventions'] = list(interventions)
+            row['concern'] = round(concern, 4)
+            if log is not None:
+                row['log'] = [str(entry) for entry in log]
+
+        if writer:
+            if isinstance(row.get('interventions'), list):
+                row['interventions'] = ';'.join(row['interventions'])
+            if 'log' in row:
+                row['log'] = ' | '.join(row['log'])
+            writer.writerow(row)
+        else:
+            out.write(json.dumps(row) + '\n')
+    return out.getvalue()
+
+def process_chunk(lines, input_format, header, output_format, include_log, fingerprint):
+    """Runs one chunk of raw lines through the whole pipeline."""
+    if _worker_fuzzy_system is None:
+        _init_worker()
+    # Each chunk uses a single knowledge base snapshot, which must be the one pinned by score_file
+    kb = current_knowledge_base()
+    if kb.fingerprint != fingerprint:
+        raise RuntimeError(f"Knowledge base changed during scoring (now version {kb.version}); "
+                           "start the run again.")
+    records = validate_records(parse_records(lines, input_format, header), kb.symptoms)
+    return serialize_records(*score_records(records, include_log, kb), output_format, kb.version)
+
+
+# --- Reading, Ordering and Checkpointing (main process) ---
+
+def read_chunks(handle, start_offset, chunk_size):
+    """Yields (lines with their byte offsets, end offset) chunks from a binary file."""
+    handle.seek(start_offset)
+    offset, chunk = start_offset, []
+    for line in handle:
+        chunk.append((offset, line))
+        offset += len(line)
+        if len(chunk) >= chunk_size:
+            yield chunk, offset
+            chunk = []
+    if chunk:
+        yield chunk, offset
+
+def ordered_map(executor, fn, chunks, max_in_flight, *args):
+    """Like executor.map but with at most `max_in_flight` chunks submitted at once."""
+    pending = deque()
+    for lines, end_offset in chunks:
+        pending.append((executor.submit(fn, lines, *args), len(lines), end_offset))
+        if len(pending) >= max_in_flight:
+            future, count, offset = pending.popleft()
+            yield future.result(), count, offset
+    while pending:
+        future, count, offset = pending.popleft()
+        yield future.result(), count, offset
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+        return int(checkpoint['offset']), int(checkpoint['output_offset']), checkpoint.get('fingerprint')
+    except (OSError, ValueError, KeyError):
+        return None, None, None
+
+def write_checkpoint(path, offset, output_offset, rows, fingerprint):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'offset': offset, 'output_offset': output_offset, 'rows': rows, 'fingerprint': fingerprint}, f)
+    os.replace(tmp, path)
+
+def detect_format(path, explicit):
+    if explicit:
+        return explicit
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+def score_file(input_path, output_path, input_format=None, output_format=None, workers=None,
+               chunk_size=5000, include_log=False, start_offset=None, resume=False,
+               checkpoint_path=None, progress_every=5.0):
+    """Scores `input_path` into `output_path`, returning the number of records processed."""
+    input_format = detect_format(input_path, input_format)
+    output_format = detect_format(output_path, output_format)
+    checkpoint_path = checkpoint_path or output_path + '.ckpt'
+    kb = current_knowledge_base()
+
+    with open(input_path, 'rb') as source:
+        header = None
+        data_start = 0
+        if input_format == 'csv':
+            header_line = source.readline()
+            header = next(csv.reader([header_line.decode('utf-8').strip()]))
+            data_start = len(header_line)
+            unknown = [h for h in header if h not in kb.symptoms and h not in ('id', 'suggestion_history')]
+            if unknown:
+                raise ValueError(f"Unknown CSV columns: {', '.join(unknown)}")
+
+        output_offset = None
+        if start_offset is None and resume:
+            start_offset, output_offset, fingerprint = read_checkpoint(checkpoint_path)
+            if start_offset is not None and fingerprint != kb.fingerprint:
+                raise ValueError("Checkpoint was written under another knowledge base; score from the start.")
+        appending = start_offset is not None and os.path.exists(output_path)
+        start_offset = max(start_offset or 0, data_start)
+
+        with open(output_path, 'r+b' if appending else 'wb') as sink, \
+                ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            if appending:
+                # Drop anything written after the last checkpoint
+                if output_offset is not None:
+                    sink.truncate(output_offset)
+                sink.seek(0, os.SEEK_END)
+            elif output_format == 'csv':
+                sink.write((','.join(CSV_FIELDS) + '\n').encode('utf-8'))
+
+            max_in_flight = 2 * (workers or os.cpu_count() or 1)
+            chunks = read_chunks(source, start_offset, chunk_size)
+            rows, started, last_report = 0, time.time(), time.time()
+            for text, count, end_offset in ordered_map(executor, process_chunk, chunks, max_in_flight,
+                                                       input_format, header, output_format, include_log,
+                                                       kb.fingerprint):
+                sink.write(text.encode('utf-8'))
+                sink.flush()
+                rows += count
+                write_checkpoint(checkpoint_path, end_offset, sink.tell(), rows, kb.fingerprint)
+
+                now = time.time()
+                if progress_every and now - last_report >= progress_every:
+                    print(f"{rows:,} rows, {rows / (now - started):,.0f} rows/sec, offset {end_offset:,}", file=sys.stderr)
+                    last_report = now
+
+    elapsed = max(time.time() - started, 1e-9)
+    print(f"Done: {rows:,} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/sec).", file=sys.stderr)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Score CSV/JSONL assessment dumps in bulk.")
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--input-format', choices=['csv', 'jsonl'])
+    parser.add_argument('--output-format', choices=['csv', 'jsonl'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--log', action='store_true', help="Include the fired-rule log for each record.")
+    parser.add_argument('--resume', action='store_true', help="Continue from the last checkpoint.")
+    parser.add_argument('--start-offset', type=int, help="Start reading at this input byte offset.")
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: OUTPUT.ckpt).")
+    parser.add_argument('--progress-every', type=float, default=5.0, help="Seconds between progress reports.")
+    args = parser.parse_args()
+
+    score_file(args.input, args.output, args.input_format, args.output_format, args.workers,
+               args.chunk_size, args.log, args.start_offset, args.resume, args.checkpoint, args.progress_every)
+
+if __name__ == "__main__":
+    main()
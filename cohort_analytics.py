@@ -0,0 +1,127 @@
+# cohort_analytics.py
+
+"""
+Population-level reporting over an AssessmentStore.
+
+Every aggregate is computed in one chunked pass over the memory-mapped
+columns: each chunk is reduced with vectorized NumPy operations into
+fixed-size accumulators (counts per condition, histogram bins, a symptom x
+symptom matrix, counts per intervention). Memory use depends on the chunk
+size and the schema, never on the number of stored assessments.
+
+A cohort is a function from a chunk (dict of column arrays) to a boolean row
+mask, e.g. `lambda chunk: chunk['concern'] >= 7`.
+
+Usage:
+    python cohort_analytics.py assessments/ --bins 20 --output report.json
+"""
+
+import argparse
+import json
+
+import numpy as np
+from assessment_store import AssessmentStore
+
+PRESENCE_THRESHOLD = 5  # same cut-off the inference engine uses for a symptom being present
+# Rows per pass; 64k rows keep the per-chunk working set around 20 MB
+CHUNK_SIZE = 1 << 16
+
+
+def iter_chunks(store, chunk_size=CHUNK_SIZE):
+    """Yields dicts of column slices, `chunk_size` rows at a time."""
+    columns = {name: store.column(name) for name in store.dtypes}
+    for start in range(0, len(store), chunk_size):
+        chunk = {name: column[start:start + chunk_size] for name, column in columns.items()}
+        chunk['symptoms'] = np.column_stack([chunk[f"symptom.{s}"] for s in store.symptom_ids])
+        yield chunk
+
+def summarize(store, cohort=None, bins=20, chunk_size=CHUNK_SIZE):
+    """
+    Condition prevalence, concern histogram, symptom prevalence and
+    co-occurrence, and intervention exposure for the whole store or a cohort.
+    """
+    symptom_count = len(store.symptom_ids)
+    rows = 0
+    condition_counts = np.zeros(len(store.conditions) + 1, dtype=np.int64)
+    bin_edges = np.linspace(0.0, 10.0, bins + 1)
+    concern_counts = np.zeros(bins, dtype=np.int64)
+    concern_sum = 0.0
+    cooccurrence = np.zeros((symptom_count, symptom_count), dtype=np.int64)
+    exposure = np.zeros(store.words * 64, dtype=np.int64)
+
+    for chunk in iter_chunks(store, chunk_size):
+        if cohort is not None:
+            mask = np.asarray(cohort(chunk), dtype=bool)
+            chunk = {name: values[mask] for name, values in chunk.items()}
+        count = len(chunk['condition'])
+        if count == 0:
+            continue
+        rows += count
+
+        condition_counts += np.bincount(chunk['condition'], minlength=len(condition_counts))
+        concern_counts += np.histogram(chunk['concern'], bin_edges)[0]
+        concern_sum += float(chunk['concern'].sum(dtype=np.float64))
+
+        # A float64 product is exact for any realistic chunk size and uses BLAS
+        present = (chunk['symptoms'] >= PRESENCE_THRESHOLD).astype(np.float64)
+        cooccurrence += (present.T @ present).astype(np.int64)
+
+        # Little-endian bytes of each word, unpacked so bit i of word w lands in column 64 * w + i
+        words = np.ascontiguousarray(chunk['interventions'], dtype='<u8').reshape(count, -1)
+        bits = np.unpackbits(words.view(np.uint8), axis=1, bitorder='little')
+        exposure += bits.sum(axis=0, dtype=np.int64)
+
+    def share(n):
+        return n / rows if rows else 0.0
+
+    return {
+        'rows': rows,
+        'condition_prevalence': {
+            condition: {'count': int(n), 'share': share(int(n))}
+            for condition, n in zip([None] + store.conditions, condition_counts)
+        },
+        'concern': {
+            'mean': concern_sum / rows if rows else None,
+            'bin_edges': bin_edges.tolist(),
+            'counts': concern_counts.tolist(),
+        },
+        'symptom_prevalence': {
+            s: {'count': int(cooccurrence[i, i]), 'share': share(int(cooccurrence[i, i]))}
+            for i, s in enumerate(store.symptom_ids)
+        },
+        'symptom_cooccurrence': {
+            'symptoms': store.symptom_ids,
+            'counts': cooccurrence.tolist(),
+        },
+        'intervention_exposure': {
+            name: {'count': int(exposure[i]), 'share': share(int(exposure[i]))}
+            for i, name in enumerate(store.interventions)
+        },
+    }
+
+def condition_cohort(store, condition_id):
+    """Cohort of assessments whose detected condition is `condition_id` (None for no pattern)."""
+    code = 0 if condition_id is None else store.conditions.index(condition_id) + 1
+    return lambda chunk: chunk['condition'] == code
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cohort analytics over an assessment store.")
+    parser.add_argument('store')
+    parser.add_argument('--condition', help="Restrict to assessments with this detected condition id.")
+    parser.add_argument('--bins', type=int, default=20, help="Concern histogram bins over 0-10.")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--output', help="Write the report here instead of stdout.")
+    args = parser.parse_args()
+
+    store = AssessmentStore.open(args.store)
+    cohort = condition_cohort(store, args.condition) if args.condition else None
+    report = json.dumps(summarize(store, cohort, args.bins, args.chunk_size), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,99 @@
 # fuzzy_engine.py
 
+import hashlib
+import json
+import os
+import tempfile
+
 import numpy as np
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
+from instrumentation import stage_start, lap
+from mamdani import MamdaniSystem
+
+# skfuzzy (and the scipy/networkx stack behind it) is imported inside
+# create_fuzzy_control_system, so only the skfuzzy path pays for it.
+
+# --- Concern Model Definition ---
+# The fuzzy variables, their trapezoidal membership functions and the rule base
+# are kept as plain data so the skfuzzy system and the compiled evaluator are
+# always built from the same definitions.
+UNIVERSE = np.arange(0, 11, 1)
+
+# Fuzzy input variable -> symptom slider it reads from
+CONCERN_INPUTS = {
+    'mood': 'depressed_mood',
+    'interest': 'loss_of_interest',
+    'worry': 'excessive_worry',
+}
+
+MEMBERSHIP_FUNCTIONS = {
+    'mood': {'low': [0, 0, 2, 4], 'medium': [3, 4, 6, 7], 'high': [6, 8, 10, 10]},
+    'interest': {'low': [0, 0, 2, 4], 'medium': [3, 4, 6, 7], 'high': [6, 8, 10, 10]},
+    'worry': {'low': [0, 0, 2, 4], 'medium': [3, 4, 6, 7], 'high': [6, 8, 10, 10]},
+    'concern': {'low': [0, 0, 2, 4], 'moderate': [3, 4, 6, 7], 'high': [6, 8, 10, 10]},
+}
 
-def create_fuzzy_control_system():
-    mood = ctrl.Antecedent(np.arange(0, 11, 1), 'mood')
-    interest = ctrl.Antecedent(np.arange(0, 11, 1), 'interest')
-    worry = ctrl.Antecedent(np.arange(0, 11, 1), 'worry')
-    concern = ctrl.Consequent(np.arange(0, 11, 1), 'concern')
+# Each rule is (operator, antecedent terms, concern term)
+CONCERN_RULES = [
+    ('and', [('mood', 'low'), ('interest', 'low')], 'high'),
+    ('or', [('worry', 'high')], 'high'),
+    ('or', [('mood', 'medium'), ('interest', 'medium'), ('worry', 'medium')], 'moderate'),
+    ('and', [('mood', 'high'), ('interest', 'high'), ('worry', 'low')], 'low'),
+]
 
-    mood['low'] = fuzz.trapmf(mood.universe, [0, 0, 2, 4])
-    mood['medium'] = fuzz.trapmf(mood.universe, [3, 4, 6, 7])
-    mood['high'] = fuzz.trapmf(mood.universe, [6, 8, 10, 10])
+# Returned when no rule fires (empty output membership)
+DEFAULT_CONCERN = 5.0
 
-    interest['low'] = fuzz.trapmf(interest.universe, [0, 0, 2, 4])
-    interest['medium'] = fuzz.trapmf(interest.universe, [3, 4, 6, 7])
-    interest['high'] = fuzz.trapmf(interest.universe, [6, 8, 10, 10])
+# Bump when the vectorized evaluator changes so saved models are rebuilt
+EVALUATOR_VERSION = 1
 
-    worry['low'] = fuzz.trapmf(worry.universe, [0, 0, 2, 4])
-    worry['medium'] = fuzz.trapmf(worry.universe, [3, 4, 6, 7])
-    worry['high'] = fuzz.trapmf(worry.universe, [6, 8, 10, 10])
+# Where compiled concern models are saved; override with MINDFUL_MODEL_CACHE
+MODEL_CACHE_DIR = os.environ.get(
+    'MINDFUL_MODEL_CACHE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.model_cache')
+)
 
-    concern['low'] = fuzz.trapmf(concern.universe, [0, 0, 2, 4])
-    concern['moderate'] = fuzz.trapmf(concern.universe, [3, 4, 6, 7])
-    concern['high'] = fuzz.trapmf(concern.universe, [6, 8, 10, 10])
 
-    rule1 = ctrl.Rule(mood['low'] & interest['low'], concern['high'])
-    rule2 = ctrl.Rule(worry['high'], concern['high'])
-    rule3 = ctrl.Rule(mood['medium'] | interest['medium'] | worry['medium'], concern['moderate'])
-    rule4 = ctrl.Rule(mood['high'] & interest['high'] & worry['low'], concern['low'])
+def create_fuzzy_control_system(universe=UNIVERSE):
+    """skfuzzy simulation of the concern model; a finer `universe` approximates the exact centroid."""
+    import skfuzzy as fuzz
+    from skfuzzy import control as ctrl
 
-    concern_ctrl = ctrl.ControlSystem([rule1, rule2, rule3, rule4])
+    variables = {name: ctrl.Antecedent(universe, name) for name in CONCERN_INPUTS}
+    variables['concern'] = ctrl.Consequent(universe, 'concern')
+
+    for name, terms in MEMBERSHIP_FUNCTIONS.items():
+        for term, params in terms.items():
+            variables[name][term] = fuzz.trapmf(variables[name].universe, params)
+
+    rules = []
+    for operator, antecedents, consequent in CONCERN_RULES:
+        antecedent = variables[antecedents[0][0]][antecedents[0][1]]
+        for name, term in antecedents[1:]:
+            if operator == 'and':
+                antecedent = antecedent & variables[name][term]
+            else:
+                antecedent = antecedent | variables[name][term]
+        rules.append(ctrl.Rule(antecedent, variables['concern'][consequent]))
+
+    concern_ctrl = ctrl.ControlSystem(rules)
     return ctrl.ControlSystemSimulation(concern_ctrl)
 
+def create_analytic_concern_system():
+    """The concern model on the exact-centroid evaluator in mamdani.py."""
+    return MamdaniSystem(
+        {name: MEMBERSHIP_FUNCTIONS[name] for name in CONCERN_INPUTS},
+        MEMBERSHIP_FUNCTIONS['concern'],
+        CONCERN_RULES,
+        inputs=CONCERN_INPUTS,
+        default=DEFAULT_CONCERN,
+    )
+
 def calculate_concern_level(simulation, user_inputs):
+    if isinstance(simulation, CompiledConcernSystem):
+        return simulation.compute(user_inputs)
+    started = stage_start()
     try:
+        if isinstance(simulation, MamdaniSystem):
+            return simulation.compute(user_inputs)
         simulation.input['mood'] = user_inputs.get('depressed_mood', 5)
         simulation.input['interest'] = user_inputs.get('loss_of_interest', 5)
         simulation.input['worry'] = user_inputs.get('excessive_worry', 5)
@@ -44,3 +102,197 @@ def calculate_concern_level(simulation, user_inputs):
     except Exception as e:
         print(f"Fuzzy calculation error: {e}")
         return 5.0
+    finally:
+        lap('fuzzy_compute', started)
+
+
+# --- Vectorized Evaluator ---
+# Reproduces skfuzzy's Mamdani pipeline (interpolated fuzzification, min/max
+# rule aggregation, universe upsampling at the cut levels and piecewise-linear
+# centroid) over a whole batch of inputs at once.
+
+def _trapmf(x, params):
+    a, b, c, d = params
+    y = np.ones(len(x))
+    if a != b:
+        rising = (x >= a) & (x < b)
+        y[x <= a] = 0.0
+        y[rising] = (x[rising] - a) / float(b - a)
+    if c != d:
+        falling = (x > c) & (x < d)
+        y[x >= d] = 0.0
+        y[falling] = (d - x[falling]) / float(d - c)
+    return y
+
+def _term_curves():
+    return {
+        name: {term: _trapmf(UNIVERSE, params) for term, params in terms.items()}
+        for name, terms in MEMBERSHIP_FUNCTIONS.items()
+    }
+
+def _crossings(mf, cuts):
+    """Universe points where each row's cut level crosses `mf` (NaN when it does not)."""
+    x = UNIVERSE.astype(float)
+    cuts = cuts[:, None]
+    above = np.where(cuts == 0.0, mf > cuts, mf >= cuts)
+    crosses = above[:, :-1] != above[:, 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        points = x[:-1] + (cuts - mf[:-1]) * (x[1:] - x[:-1]) / (mf[1:] - mf[:-1])
+    return np.where(crosses, points, np.nan)
+
+def _centroid(x, mfx):
+    x1, x2 = x[:, :-1], x[:, 1:]
+    y1, y2 = mfx[:, :-1], mfx[:, 1:]
+    width = x2 - x1
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        moment = np.where(
+            y1 == y2, 0.5 * (x1 + x2),
+            np.where(y1 == 0.0, 2.0 / 3.0 * width + x1,
+                     np.where(y2 == 0.0, 1.0 / 3.0 * width + x1,
+                              (2.0 / 3.0 * width * (y2 + 0.5 * y1)) / (y1 + y2) + x1)))
+    area = np.where(
+        y1 == y2, width * y1,
+        np.where(y1 == 0.0, 0.5 * width * y2,
+                 np.where(y2 == 0.0, 0.5 * width * y1, 0.5 * width * (y1 + y2))))
+
+    skip = ((y1 == 0.0) & (y2 == 0.0)) | (x1 == x2)
+    moment_area = np.where(skip, 0.0, moment * area)
+    area = np.where(skip, 0.0, area)
+
+    # Accumulate left to right like skfuzzy so results match to the last bit
+    sum_moment_area = np.cumsum(moment_area, axis=1)[:, -1]
+    sum_area = np.cumsum(area, axis=1)[:, -1]
+    return sum_moment_area / np.fmax(sum_area, np.finfo(float).eps)
+
+def evaluate_concern(inputs):
+    """Computes the concern score for an (N, 3) array of mood/interest/worry inputs."""
+    inputs = np.clip(np.asarray(inputs, dtype=float).reshape(-1, len(CONCERN_INPUTS)),
+                     UNIVERSE.min(), UNIVERSE.max())
+    curves = _term_curves()
+
+    memberships = {}
+    for column, name in enumerate(CONCERN_INPUTS):
+        for term, mf in curves[name].items():
+            memberships[name, term] = np.interp(inputs[:, column], UNIVERSE, mf)
+
+    cuts = {term: None for term in curves['concern']}
+    for operator, antecedents, consequent in CONCERN_RULES:
+        combine = np.fmin if operator == 'and' else np.fmax
+        firing = memberships[antecedents[0]]
+        for antecedent in antecedents[1:]:
+            firing = combine(firing, memberships[antecedent])
+        cuts[consequent] = firing if cuts[consequent] is None else np.fmax(cuts[consequent], firing)
+
+    points = [np.broadcast_to(UNIVERSE.astype(float), (len(inputs), len(UNIVERSE)))]
+    for term, mf in curves['concern'].items():
+        points.append(_crossings(mf, cuts[term]))
+    x = np.sort(np.concatenate(points, axis=1), axis=1)
+    x = np.where(np.isnan(x), float(UNIVERSE.max()), x)
+
+    output_mf = np.zeros_like(x)
+    for term, mf in curves['concern'].items():
+        clipped = np.minimum(cuts[term][:, None], np.interp(x, UNIVERSE, mf))
+        np.maximum(output_mf, clipped, out=output_mf)
+
+    # Duplicate points have zero width and drop out of the centroid sum
+    concern = _centroid(x, output_mf)
+    return np.where(output_mf.sum(axis=1) == 0, DEFAULT_CONCERN, concern)
+
+
+# --- Compiled Lookup Table ---
+
+class CompiledConcernSystem:
+    """
+    Concern scores precomputed for every integer slider combination.
+
+    Unlike a ControlSystemSimulation it holds no per-call input state, so a
+    single instance can be shared by every session and thread in a process.
+    """
+
+    def __init__(self, surface):
+        self.surface = surface
+        self.surface.setflags(write=False)
+
+    def evaluate(self, inputs):
+        """Scores an (N, 3) array; integer rows are table lookups, the rest are evaluated."""
+        started = stage_start()
+        scores = self._evaluate(inputs)
+        lap('fuzzy_compute', started)
+        return scores
+
+    def _evaluate(self, inputs):
+        inputs = np.asarray(inputs, dtype=float).reshape(-1, len(CONCERN_INPUTS))
+        low, high = UNIVERSE.min(), UNIVERSE.max()
+        on_grid = np.all((inputs == np.round(inputs)) & (inputs >= low) & (inputs <= high), axis=1)
+
+        scores = np.empty(len(inputs))
+        index = (inputs[on_grid] - low).astype(np.intp)
+        scores[on_grid] = self.surface[tuple(index.T)]
+        if not on_grid.all():
+            scores[~on_grid] = evaluate_concern(inputs[~on_grid])
+        return scores
+
+    def compute(self, user_inputs):
+        started = stage_start()
+        row = [user_inputs.get(symptom, 5) for symptom in CONCERN_INPUTS.values()]
+        low, high = UNIVERSE.min(), UNIVERSE.max()
+        if all(isinstance(v, int) and low <= v <= high for v in row):
+            score = float(self.surface[tuple(v - low for v in row)])
+        else:
+            score = float(self._evaluate([row])[0])
+        lap('fuzzy_compute', started)
+        return score
+
+def compile_concern_system():
+    grid = np.stack(np.meshgrid(*[UNIVERSE] * len(CONCERN_INPUTS), indexing='ij'), axis=-1)
+    surface = evaluate_concern(grid.reshape(-1, len(CONCERN_INPUTS)))
+    return CompiledConcernSystem(surface.reshape(grid.shape[:-1]))
+
+def calculate_concern_levels(simulation, inputs):
+    """Batch counterpart of calculate_concern_level for an (N, 3) array of inputs."""
+    if isinstance(simulation, (CompiledConcernSystem, MamdaniSystem)):
+        return simulation.evaluate(inputs)
+    rows = np.asarray(inputs, dtype=float).reshape(-1, len(CONCERN_INPUTS))
+    return np.array([
+        calculate_concern_level(simulation, dict(zip(CONCERN_INPUTS.values(), row))) for row in rows
+    ])
+
+def model_fingerprint():
+    """Hash of everything the compiled surface depends on: universe, inputs, membership functions and rules."""
+    definition = {
+        'universe': UNIVERSE.tolist(),
+        'inputs': CONCERN_INPUTS,
+        'membership_functions': MEMBERSHIP_FUNCTIONS,
+        'rules': CONCERN_RULES,
+        'default': DEFAULT_CONCERN,
+        'evaluator_version': EVALUATOR_VERSION,
+    }
+    return hashlib.sha256(json.dumps(definition, sort_keys=True).encode('utf-8')).hexdigest()
+
+def load_concern_system(cache_dir=None):
+    """
+    Returns the compiled concern system, loading it from a saved artifact when
+    one matches the current model definition and compiling (and saving) it
+    otherwise. An unwritable cache directory only means it is not saved.
+    """
+    cache_dir = cache_dir or MODEL_CACHE_DIR
+    path = os.path.join(cache_dir, f"concern_model_{model_fingerprint()[:16]}.npy")
+    try:
+        surface = np.load(path, allow_pickle=False)
+        if surface.shape == (len(UNIVERSE),) * len(CONCERN_INPUTS):
+            return CompiledConcernSystem(surface)
+    except (OSError, ValueError):
+        pass
+
+    system = compile_concern_system()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first so concurrent processes never read a partial artifact
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, system.surface, allow_pickle=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Could not save compiled concern model: {e}")
+    return system
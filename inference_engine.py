@@ -1,104 +1,524 @@
 # inference_engine.py
 
-from knowledge_base import CONDITIONS, INTERVENTIONS
+import hashlib
+import heapq
+import json
+from collections import namedtuple
+
+import numpy as np
+from knowledge_base import SYMPTOMS, CONDITIONS, INTERVENTIONS
+from instrumentation import stage_start, lap
+
+# --- Core Symptom Policies ---
+# Maps a condition's 'core_policy' to a test on (core symptoms present, core symptoms defined).
+# Only comparisons are used so the same policies work on NumPy count arrays in `run_batch`.
+CORE_POLICIES = {
+    'any': lambda present, defined: present >= 1,
+    'all': lambda present, defined: present == defined,
+}
+
+def content_fingerprint(*parts):
+    """Stable SHA-256 of JSON-serializable knowledge base content."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+CompiledRule = namedtuple('CompiledRule', [
+    'condition_id', 'details', 'core_symptoms', 'other_symptoms',
+    'core_mask', 'other_mask', 'core_total', 'policy', 'threshold', 'priority', 'specificity',
+])
+
+
+class RuleNetwork:
+    """
+    CONDITIONS compiled once into bitmasks over the symptom index, plus an
+    inverted index from each core symptom to the rules it can activate, so a
+    run only visits rules reachable from the symptoms that are present.
+
+    `rules` and `fingerprint` may be passed in already compiled (see
+    knowledge_store.py); otherwise they are derived from `conditions`.
+    `matrices` optionally gives the (core, other) boolean rule x symptom
+    arrays for those rules, e.g. memory-mapped from a compiled file.
+    """
+
+    def __init__(self, symptoms, conditions, rules=None, fingerprint=None, matrices=None):
+        self.fingerprint = fingerprint or content_fingerprint(symptoms, conditions)
+        self.symptoms = symptoms
+        self.conditions = conditions
+        # Knowledge bases without their own safety meta-rule fall back to the built-in one
+        self.safety_condition = conditions.get('SAFETY_CRITICAL', CONDITIONS['SAFETY_CRITICAL'])
+        self.symptom_ids = list(symptoms)
+        self.symptom_bits = {s: 1 << i for i, s in enumerate(self.symptom_ids)}
+        self.rules = []
+        self.rules_by_symptom = {s: [] for s in self.symptom_ids}
+        self.rules_referencing = {s: [] for s in self.symptom_ids}
+        self.unconditional_rules = []
+
+        if rules is None:
+            rules = [
+                self.compile_rule(condition_id, details) for condition_id, details in conditions.items()
+                if details.get('priority', 0) < 100
+            ]
+
+        for rule in rules:
+            core_symptoms, other_symptoms = rule.core_symptoms, rule.other_symptoms
+            position = len(self.rules)
+            self.rules.append(rule)
+            # A rule whose policy holds with no core symptoms present must always be checked
+            if rule.policy(0, rule.core_total):
+                self.unconditional_rules.append(position)
+            else:
+                for s in core_symptoms:
+                    self.rules_by_symptom[s].append(position)
+            for s in core_symptoms + other_symptoms:
+                self.rules_referencing[s].append(position)
+
+        # Dense boolean views of the masks for the vectorized batch path
+        if matrices is None:
+            shape = (len(self.rules), len(self.symptom_ids))
+            matrices = (
+                np.array([self.mask_array(r.core_symptoms) for r in self.rules], dtype=bool).reshape(shape),
+                np.array([self.mask_array(r.other_symptoms) for r in self.rules], dtype=bool).reshape(shape),
+            )
+        self.core_matrix, self.other_matrix = matrices
+
+    def compile_rule(self, condition_id, details):
+        policy_name = details.get('core_policy', 'any')
+        if policy_name not in CORE_POLICIES:
+            raise ValueError(f"Unknown core_policy '{policy_name}' for condition '{condition_id}'.")
+
+        core_symptoms = tuple(details['core_symptoms'])
+        other_symptoms = tuple(details.get('other_symptoms', []))
+        return CompiledRule(
+            condition_id=condition_id,
+            details=details,
+            core_symptoms=core_symptoms,
+            other_symptoms=other_symptoms,
+            core_mask=self.mask(core_symptoms),
+            other_mask=self.mask(other_symptoms),
+            core_total=len(core_symptoms),
+            policy=CORE_POLICIES[policy_name],
+            threshold=details['threshold'],
+            priority=details['priority'],
+            specificity=len(core_symptoms) + len(other_symptoms),
+        )
+
+    def mask(self, symptoms):
+        bits = 0
+        for s in symptoms:
+            bits |= self.symptom_bits[s]
+        return bits
+
+    def mask_array(self, symptoms):
+        return np.array([s in symptoms for s in self.symptom_ids], dtype=bool)
+
+    def candidate_rules(self, present_symptoms):
+        """Positions of the rules fed by the present symptoms, in CONDITIONS order."""
+        positions = set(self.unconditional_rules)
+        for s in present_symptoms:
+            positions.update(self.rules_by_symptom.get(s, ()))
+        return sorted(positions)
+
+
+RULE_NETWORK = RuleNetwork(SYMPTOMS, CONDITIONS)
+
+# Columns of the `run_batch` symptom matrix follow the order of SYMPTOMS.
+SYMPTOM_IDS = RULE_NETWORK.symptom_ids
+
+
+# Upper bound on the relevance matrix cells `top_k_batch` builds at once (8 MB of float64)
+TOP_K_BLOCK_CELLS = 1 << 20
+
+
+class InterventionIndex:
+    """
+    INTERVENTIONS with an inverted index from each target symptom to the
+    interventions addressing it, for single-pass top-k selection.
+
+    `target_matrix` optionally gives the boolean intervention x symptom
+    target array, e.g. memory-mapped from a compiled knowledge base.
+    """
+
+    # Reserved for the safety short-circuit and never suggested by relevance
+    RESERVED = frozenset(["Seek Immediate Help"])
+
+    def __init__(self, interventions, symptom_ids, target_matrix=None, fingerprint=None):
+        self.fingerprint = fingerprint or content_fingerprint(interventions, symptom_ids)
+        self.interventions = interventions
+        self.safety_intervention = interventions.get('Seek Immediate Help', INTERVENTIONS['Seek Immediate Help'])
+        self.names = list(interventions)
+        # Dense target matrix for the vectorized batch path
+        if target_matrix is None:
+            positions = {s: i for i, s in enumerate(symptom_ids)}
+            target_matrix = np.zeros((len(self.names), len(symptom_ids)), dtype=bool)
+            for position, name in enumerate(self.names):
+                for s in interventions[name]['target']:
+                    if s in positions:
+                        target_matrix[position, positions[s]] = True
+        self.target_matrix = target_matrix
+
+        # Row-major order keeps each symptom's list in INTERVENTIONS order
+        self.by_target = {}
+        for position, i in zip(*np.nonzero(target_matrix)):
+            self.by_target.setdefault(symptom_ids[i], []).append(int(position))
+
+    def top_k(self, symptoms, history, k=3):
+        """
+        The k most relevant interventions (target symptoms in common), ties
+        going to the earlier entry in INTERVENTIONS, skipping `history`. When
+        fewer than k share a symptom the rest are filled in INTERVENTIONS order.
+        """
+        excluded = self.RESERVED.union(history)
+
+        relevance = {}
+        for s in set(symptoms):
+            for position in self.by_target.get(s, ()):
+                relevance[position] = relevance.get(position, 0) + 1
+
+        ranked = heapq.nsmallest(
+            k,
+            ((-score, position) for position, score in relevance.items() if self.names[position] not in excluded)
+        )
+        selected = [position for _, position in ranked]
+
+        if len(selected) < k:
+            for position, name in enumerate(self.names):
+                if len(selected) >= k:
+                    break
+                if position not in relevance and name not in excluded:
+                    selected.append(position)
+
+        return {self.names[position]: self.interventions[self.names[position]] for position in selected}
+
+    def top_k_batch(self, symptom_matrix, history, k=3):
+        """
+        `top_k` for every row of an (N x len(symptom_ids)) boolean matrix, as
+        lists of intervention positions. Rows are ranked in blocks, and only
+        over the interventions some row in the block can reach plus the first
+        k candidates (enough to fill any row in INTERVENTIONS order), so
+        memory stays bounded however many interventions there are.
+        """
+        symptom_matrix = np.asarray(symptom_matrix, dtype=bool)
+        excluded = self.RESERVED.union(history)
+        candidates = np.array([i for i, name in enumerate(self.names) if name not in excluded], dtype=np.intp)
+        if k <= 0 or len(candidates) == 0:
+            return [[] for _ in range(len(symptom_matrix))]
+        targets = self.target_matrix[candidates]
+        # More relevant first, then earlier in INTERVENTIONS: rank - relevance * M orders both at once
+        scale = len(candidates)
+
+        ranking = []
+        block_rows = max(1, TOP_K_BLOCK_CELLS // len(candidates))
+        for start in range(0, len(symptom_matrix), block_rows):
+            block = symptom_matrix[start:start + block_rows]
+            reachable = targets[:, block.any(axis=0)].any(axis=1)
+            reachable[:k] = True
+            columns = np.flatnonzero(reachable)
+
+            # A float64 product is exact for these counts and uses BLAS; lower keys rank first
+            key = block.astype(np.float64) @ targets[columns].T.astype(np.float64)
+            key *= -scale
+            key += columns
+            if len(columns) > k:
+                top = np.argpartition(key, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(len(columns)), (len(block), len(columns)))
+            order = np.argsort(np.take_along_axis(key, top, axis=1), axis=1)
+            ranking.extend(candidates[columns[np.take_along_axis(top, order, axis=1)]].tolist())
+        return ranking
+
+
+INTERVENTION_INDEX = InterventionIndex(INTERVENTIONS, SYMPTOM_IDS)
+
+
+def _condition_data(rule, total_symptoms_matched, present_symptoms):
+    specificity_score = rule.specificity
+    match_score = (total_symptoms_matched / specificity_score) * 100 if specificity_score > 0 else 0
+
+    # Create a copy to avoid modifying the original KNOWLEDGE_BASE constant
+    condition_data = rule.details.copy()
+    condition_data['id'] = rule.condition_id
+    condition_data['symptoms_matched'] = [
+        s for s in rule.core_symptoms + rule.other_symptoms if s in present_symptoms
+    ]
+    condition_data['specificity'] = specificity_score
+    condition_data['match'] = match_score
+    return condition_data
+
+class LogEvent(namedtuple('LogEvent', ['kind', 'rule', 'specificity', 'match'], defaults=(None, None, None))):
+    """
+    One explanation log entry. Entries are stored as plain records and only
+    turned into text by `str()` when the log is actually rendered.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        if self.kind == 'safety':
+            return "Safety-critical rule triggered. Halting further analysis."
+        if self.kind == 'considered':
+            return f"Rule '{self.rule}' considered. Specificity: {self.specificity}, Match: {self.match:.0f}%."
+        if self.kind == 'selected':
+            return f"**Conflict Resolution: '{self.rule}' selected as best fit.**"
+        return f"{self.kind}: {self.rule}"
+
+def _considered_message(condition_data):
+    return LogEvent('considered', condition_data['name'], condition_data['specificity'], condition_data['match'])
+
 
 class InferenceEngine:
-    def __init__(self):
+    """
+    Forward-chaining engine over the compiled rule network.
+
+    With `incremental=True` the engine keeps Rete-style partial-match state
+    (core/other counts and matched conditions) between runs. `add_fact` then
+    only revisits the rules that reference the changed symptom, and only when
+    its presence flips, so re-analyzing after one slider move is cheap.
+    Results are identical to a full `run`. Facts must go through `add_fact`
+    in this mode.
+    """
+
+    def __init__(self, network=None, intervention_index=None, incremental=False):
         self.facts = {}
         self.fired_rules_log = []
+        self.network = network if network is not None else RULE_NETWORK
+        self.intervention_index = intervention_index if intervention_index is not None else INTERVENTION_INDEX
+        self.incremental = incremental
+        if incremental:
+            self._reset_matches()
 
     def add_fact(self, symptom, value):
         self.facts[symptom] = value
+        if self.incremental:
+            self._propagate(symptom, value >= 5)
+
+    # --- Incremental Match State ---
+
+    def _reset_matches(self):
+        rule_count = len(self.network.rules)
+        self._present = set()
+        self._core_counts = [0] * rule_count
+        self._other_counts = [0] * rule_count
+        self._matched = {}  # rule position -> condition data, for every rule currently satisfied
+        self._best_position = None  # cached conflict resolution winner; None when it must be re-ranked
+        for position in range(rule_count):
+            self._update_match(position)
+
+    def _propagate(self, symptom, present):
+        if present == (symptom in self._present):
+            return
+        if present:
+            self._present.add(symptom)
+        else:
+            self._present.discard(symptom)
+
+        delta = 1 if present else -1
+        bit = self.network.symptom_bits.get(symptom, 0)
+        for position in self.network.rules_referencing.get(symptom, ()):
+            if self.network.rules[position].core_mask & bit:
+                self._core_counts[position] += delta
+            else:
+                self._other_counts[position] += delta
+            self._update_match(position)
+
+    def _update_match(self, position):
+        rule = self.network.rules[position]
+        core_count = self._core_counts[position]
+        total_symptoms_matched = core_count + self._other_counts[position]
+
+        if rule.policy(core_count, rule.core_total) and total_symptoms_matched >= rule.threshold:
+            self._matched[position] = _condition_data(rule, total_symptoms_matched, self._present)
+        elif position in self._matched:
+            del self._matched[position]
+        else:
+            return
+        self._best_position = None
+
+    def _matched_incremental(self):
+        """Positions and copies of the currently matched conditions, in CONDITIONS order."""
+        positions = sorted(self._matched)
+        potential_conditions = []
+        for position in positions:
+            condition_data = self._matched[position].copy()
+            condition_data['symptoms_matched'] = list(condition_data['symptoms_matched'])
+            potential_conditions.append(condition_data)
+        return positions, potential_conditions
+
+    def _best_incremental(self, positions):
+        """Index into `positions` of the conflict resolution winner, re-ranked only after a change."""
+        if self._best_position is None:
+            self._best_position = max(
+                positions,
+                key=lambda p: (self._matched[p]['priority'], self._matched[p]['specificity'], self._matched[p]['match'])
+            )
+        return positions.index(self._best_position)
 
-    def run(self, suggestion_history=None):
+    def run(self, suggestion_history=None, max_interventions=3):
         if suggestion_history is None:
             suggestion_history = []
             
         self.fired_rules_log = []
+        started = stage_start()
         
         present_symptoms = {s for s, v in self.facts.items() if v >= 5}
 
         # --- STRATEGY 1: CHECK FOR SAFETY-CRITICAL RULES FIRST ---
         if 'thoughts_of_harm' in present_symptoms:
-            self.fired_rules_log.append("Safety-critical rule triggered. Halting further analysis.")
-            safety_rule = CONDITIONS['SAFETY_CRITICAL'].copy() # Use .copy() to avoid modifying the original
+            self.fired_rules_log.append(LogEvent('safety'))
+            safety_rule = self.network.safety_condition.copy() # Use .copy() to avoid modifying the original
             safety_rule['id'] = 'SAFETY_CRITICAL' # ** THIS LINE FIXES THE KeyError **
-            return [safety_rule], {'Seek Immediate Help': INTERVENTIONS['Seek Immediate Help']}, self.fired_rules_log
+            lap('safety_check', started)
+            return [safety_rule], {'Seek Immediate Help': self.intervention_index.safety_intervention}, self.fired_rules_log
+        started = lap('safety_check', started)
 
         # --- If no safety issue, proceed with standard analysis ---
+        if self.incremental:
+            positions, potential_conditions = self._matched_incremental()
+            self.fired_rules_log.extend(_considered_message(c) for c in potential_conditions)
+            started = lap('condition_matching', started)
+            if not potential_conditions:
+                return [], self._get_interventions(present_symptoms, suggestion_history, max_interventions), self.fired_rules_log
+            best = self._best_incremental(positions)
+            lap('conflict_resolution', started)
+            return self._finish(potential_conditions[best], suggestion_history, max_interventions)
+
+        # Only rules reachable from a present symptom through the inverted index are visited.
+        present_bits = self.network.mask(s for s in present_symptoms if s in self.network.symptom_bits)
+
         potential_conditions = []
-        for condition_id, details in CONDITIONS.items():
-            if details.get('priority', 0) >= 100:
+        for position in self.network.candidate_rules(present_symptoms):
+            rule = self.network.rules[position]
+
+            core_count = (present_bits & rule.core_mask).bit_count()
+            if not rule.policy(core_count, rule.core_total):
                 continue
 
-            core_symptoms_present = [s for s in details['core_symptoms'] if s in present_symptoms]
-            
-            core_condition_met = False
-            if condition_id in ['MDD', 'GAD'] and len(core_symptoms_present) >= 1:
-                core_condition_met = True
-            elif condition_id in ['PanicDisorder', 'SocialAnxiety'] and len(core_symptoms_present) == len(details['core_symptoms']):
-                core_condition_met = True
-            elif condition_id == 'Burnout' and len(core_symptoms_present) >= 1:
-                 core_condition_met = True
-
-            if core_condition_met:
-                other_symptoms_present = [s for s in details.get('other_symptoms', []) if s in present_symptoms]
-                total_symptoms_matched = len(core_symptoms_present) + len(other_symptoms_present)
-                
-                if total_symptoms_matched >= details['threshold']:
-                    num_defined_symptoms = len(details['core_symptoms']) + len(details.get('other_symptoms', []))
-                    
-                    specificity_score = num_defined_symptoms
-                    match_score = (total_symptoms_matched / num_defined_symptoms) * 100 if num_defined_symptoms > 0 else 0
-                    
-                    # Create a copy to avoid modifying the original KNOWLEDGE_BASE constant
-                    condition_data = details.copy()
-                    condition_data['id'] = condition_id
-                    condition_data['symptoms_matched'] = core_symptoms_present + other_symptoms_present
-                    condition_data['specificity'] = specificity_score
-                    condition_data['match'] = match_score
-                    
-                    potential_conditions.append(condition_data)
-                    self.fired_rules_log.append(f"Rule '{details['name']}' considered. Specificity: {specificity_score}, Match: {match_score:.0f}%.")
+            total_symptoms_matched = core_count + (present_bits & rule.other_mask).bit_count()
+            if total_symptoms_matched >= rule.threshold:
+                condition_data = _condition_data(rule, total_symptoms_matched, present_symptoms)
+                potential_conditions.append(condition_data)
+                self.fired_rules_log.append(_considered_message(condition_data))
+        started = lap('condition_matching', started)
 
         if not potential_conditions:
-            return [], self._get_interventions(present_symptoms, suggestion_history), self.fired_rules_log
+            return [], self._get_interventions(present_symptoms, suggestion_history, max_interventions), self.fired_rules_log
 
         sorted_conditions = sorted(
             potential_conditions,
             key=lambda x: (x['priority'], x['specificity'], x['match']),
             reverse=True
         )
+        lap('conflict_resolution', started)
         
-        best_condition = sorted_conditions[0]
+        return self._finish(sorted_conditions[0], suggestion_history, max_interventions)
+
+    def _finish(self, best_condition, suggestion_history, max_interventions):
         detected_conditions = [best_condition]
-        self.fired_rules_log.append(f"**Conflict Resolution: '{best_condition['name']}' selected as best fit.**")
+        self.fired_rules_log.append(LogEvent('selected', best_condition['name']))
 
         all_matched_symptoms = set()
         for c in detected_conditions:
             all_matched_symptoms.update(c['symptoms_matched'])
 
-        suggested_interventions = self._get_interventions(all_matched_symptoms, suggestion_history)
+        suggested_interventions = self._get_interventions(all_matched_symptoms, suggestion_history, max_interventions)
 
         return detected_conditions, suggested_interventions, self.fired_rules_log
 
-    def _get_interventions(self, symptoms, history):
-        suggestions = {}
-        for _ in range(3):
-            best_suggestion = None
-            highest_relevance = -1
-            
-            for name, details in INTERVENTIONS.items():
-                if name in history or name in suggestions or name == "Seek Immediate Help":
-                    continue
-                
-                relevance = len(set(details['target']) & set(symptoms))
-                if relevance > highest_relevance:
-                    highest_relevance = relevance
-                    best_suggestion = {name: details}
-            
-            if best_suggestion:
-                suggestions.update(best_suggestion)
+    def _get_interventions(self, symptoms, history, k=3):
+        started = stage_start()
+        interventions = self.intervention_index.top_k(symptoms, history, k)
+        lap('interventions', started)
+        return interventions
+
+    def run_batch(self, symptom_matrix, suggestion_history=None, max_interventions=3):
+        """
+        Vectorized counterpart of `run` for an (N x len(SYMPTOMS)) matrix of
+        slider values, columns ordered as SYMPTOMS. Returns per-row lists of
+        detected conditions and intervention dicts identical to `run`.
+        """
+        if suggestion_history is None:
+            suggestion_history = []
+
+        network = self.network
+        present, safety, best, best_specificity, best_match = self.select_batch(symptom_matrix)
+        num_rows = len(present)
+
+        # --- Intervention ranking over the symptoms each row's selection is based on ---
+        matched = np.zeros_like(present)
+        has_condition = best >= 0
+        rule_masks = network.core_matrix | network.other_matrix
+        matched[has_condition] = present[has_condition] & rule_masks[best[has_condition]]
+        target_symptoms = np.where(has_condition[:, None], matched, present)
+
+        index = self.intervention_index
+        ranking = index.top_k_batch(target_symptoms, suggestion_history, max_interventions)
+
+        # --- Assemble results shaped like `run` ---
+        batch_conditions, batch_interventions = [], []
+        for row in range(num_rows):
+            if safety[row]:
+                safety_rule = network.safety_condition.copy()
+                safety_rule['id'] = 'SAFETY_CRITICAL'
+                batch_conditions.append([safety_rule])
+                batch_interventions.append({'Seek Immediate Help': index.safety_intervention})
+                continue
+
+            if has_condition[row]:
+                rule = network.rules[best[row]]
+                condition_data = rule.details.copy()
+                condition_data['id'] = rule.condition_id
+                condition_data['symptoms_matched'] = [
+                    s for s in rule.core_symptoms + rule.other_symptoms
+                    if matched[row, network.symptom_ids.index(s)]
+                ]
+                condition_data['specificity'] = int(best_specificity[row])
+                condition_data['match'] = float(best_match[row])
+                batch_conditions.append([condition_data])
             else:
-                break
-        return suggestions
+                batch_conditions.append([])
+
+            names = [index.names[position] for position in ranking[row]]
+            batch_interventions.append({name: index.interventions[name] for name in names})
+
+        return batch_conditions, batch_interventions
+
+    def select_batch(self, symptom_matrix):
+        """
+        Condition matching and conflict resolution of `run_batch` without
+        building any results. Returns per-row arrays: symptoms present, the
+        safety flag, the winning rule position in `network.rules` (-1 when no
+        rule fires or the safety rule applies) and its specificity and match.
+        """
+        network = self.network
+        present = np.asarray(symptom_matrix) >= 5
+        num_rows = len(present)
+
+        # --- Safety short-circuit ---
+        safety = present[:, network.symptom_ids.index('thoughts_of_harm')]
+
+        # --- Condition matching and conflict resolution, one rule at a time over all rows ---
+        best = np.full(num_rows, -1)
+        best_priority = np.full(num_rows, -np.inf)
+        best_specificity = np.full(num_rows, -np.inf)
+        best_match = np.full(num_rows, -np.inf)
+
+        for position, rule in enumerate(network.rules):
+            core_count = (present & network.core_matrix[position]).sum(axis=1)
+            other_count = (present & network.other_matrix[position]).sum(axis=1)
+            core_met = rule.policy(core_count, rule.core_total)
+
+            total = core_count + other_count
+            fires = ~safety & core_met & (total >= rule.threshold)
+
+            specificity = rule.specificity
+            match = (total / specificity) * 100 if specificity > 0 else np.zeros(num_rows)
+            priority = rule.priority
+
+            better = fires & (
+                (priority > best_priority)
+                | ((priority == best_priority) & (specificity > best_specificity))
+                | ((priority == best_priority) & (specificity == best_specificity) & (match > best_match))
+            )
+            best = np.where(better, position, best)
+            best_priority = np.where(better, priority, best_priority)
+            best_specificity = np.where(better, specificity, best_specificity)
+            best_match = np.where(better, match, best_match)
+
+        return present, safety, best, best_specificity, best_match
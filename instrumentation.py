@@ -0,0 +1,141 @@
+# instrumentation.py
+
+"""
+Per-stage timing hooks for the scoring hot path.
+
+The engine and the fuzzy evaluator report how long each stage took
+('safety_check', 'condition_matching', 'conflict_resolution',
+'interventions', 'fuzzy_compute') to every registered hook. With no hooks
+registered the instrumented code skips the clock entirely.
+
+StageMetrics is the built-in hook: it keeps a bounded window of recent
+durations per stage and exports counts, totals and percentiles in Prometheus
+text format. Setting MINDFUL_METRICS_DIR installs one per process and
+periodically writes `stages-<pid>.prom` there, for a textfile collector or
+for reading directly.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+_hooks = []
+
+
+def add_stage_hook(hook):
+    """Registers `hook(stage, seconds)` to be called after every timed stage."""
+    _hooks.append(hook)
+
+def remove_stage_hook(hook):
+    _hooks.remove(hook)
+
+def stage_start():
+    """Start time for a stage, or None when nobody is listening."""
+    return time.perf_counter() if _hooks else None
+
+def lap(stage, start):
+    """Reports the time since `start` for `stage` and returns the start of the next stage."""
+    if start is None:
+        return None
+    now = time.perf_counter()
+    for hook in _hooks:
+        hook(stage, now - start)
+    return now
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class StageMetrics:
+    """Stage duration collector with percentile export."""
+
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self, window=10000, export_path=None, export_interval=15.0):
+        self.window = window
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self.samples = {}
+        self.counts = {}
+        self.totals = {}
+        self.lock = threading.Lock()
+        self.last_export = time.monotonic()
+
+    def __call__(self, stage, seconds):
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.window)
+                self.counts[stage] = 0
+                self.totals[stage] = 0.0
+            self.samples[stage].append(seconds)
+            self.counts[stage] += 1
+            self.totals[stage] += seconds
+            # The export slot is claimed under the lock so only one thread writes per interval
+            now = time.monotonic()
+            export = self.export_path and now - self.last_export >= self.export_interval
+            if export:
+                self.last_export = now
+        if export:
+            self._export(self.export_path)
+
+    def summary(self):
+        """{stage: {'count', 'sum', 'p50', 'p90', 'p99'}} in seconds."""
+        with self.lock:
+            snapshot = {stage: (sorted(samples), self.counts[stage], self.totals[stage])
+                        for stage, samples in self.samples.items()}
+        summary = {}
+        for stage, (ordered, count, total) in snapshot.items():
+            summary[stage] = {'count': count, 'sum': total}
+            for q in self.QUANTILES:
+                summary[stage][f"p{int(q * 100)}"] = _percentile(ordered, q)
+        return summary
+
+    def prometheus(self):
+        """Prometheus text exposition of the stage durations as a summary metric."""
+        lines = [
+            "# HELP mindful_stage_duration_seconds Time spent in each scoring stage.",
+            "# TYPE mindful_stage_duration_seconds summary",
+        ]
+        for stage, stats in sorted(self.summary().items()):
+            for q in self.QUANTILES:
+                lines.append(f'mindful_stage_duration_seconds{{stage="{stage}",quantile="{q}"}} '
+                             f'{stats[f"p{int(q * 100)}"]:.9f}')
+            lines.append(f'mindful_stage_duration_seconds_sum{{stage="{stage}"}} {stats["sum"]:.9f}')
+            lines.append(f'mindful_stage_duration_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Atomically writes the Prometheus text to `path`."""
+        with self.lock:
+            self.last_export = time.monotonic()
+        self._export(path)
+
+    def _export(self, path):
+        # A temp file per thread, so concurrent writers never share one
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'w') as f:
+                f.write(self.prometheus())
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Could not write stage metrics: {e}")
+
+
+def enable_metrics(export_path=None, export_interval=15.0, window=10000):
+    """Installs and returns a StageMetrics hook for this process."""
+    metrics = StageMetrics(window, export_path, export_interval)
+    add_stage_hook(metrics)
+    return metrics
+
+# Zero-configuration export for the app, service workers and bulk workers alike
+PROCESS_METRICS = None
+if os.environ.get('MINDFUL_METRICS_DIR'):
+    PROCESS_METRICS = enable_metrics(
+        os.path.join(os.environ['MINDFUL_METRICS_DIR'], f"stages-{os.getpid()}.prom"),
+        float(os.environ.get('MINDFUL_METRICS_INTERVAL', 15.0)),
+    )
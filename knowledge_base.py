@@ -27,12 +27,15 @@ SYMPTOMS = {
 # --- 2. Rule Base for Conditions ---
 # Added Panic Disorder, Social Anxiety, and a high-priority Safety Rule.
 # Each rule now has a 'priority' for the conflict resolution strategy.
+# 'core_policy' says how many core symptoms must be present for the rule to be
+# considered: 'any' (at least one) or 'all' (every core symptom).
 CONDITIONS = {
     # --- META-RULE (Highest Priority) ---
     'SAFETY_CRITICAL': {
         'name': 'Immediate Safety Concern',
         'priority': 100,
         'core_symptoms': ['thoughts_of_harm'],
+        'core_policy': 'any',
         'threshold': 1, # Requires any score > 5 on the single symptom
         'explanation': 'Your responses indicate thoughts of harm, which requires immediate attention.'
     },
@@ -43,6 +46,7 @@ CONDITIONS = {
         'priority': 10,
         'core_symptoms': ['panic_attacks', 'fear_of_panic'],
         'other_symptoms': ['restlessness'],
+        'core_policy': 'all',
         'threshold': 3, # Both core symptoms must be present, plus restlessness
         'explanation': 'The experience of recurring panic attacks and a persistent fear of having more is a key pattern of Panic Disorder.'
     },
@@ -51,6 +55,7 @@ CONDITIONS = {
         'priority': 10,
         'core_symptoms': ['social_fear', 'social_avoidance'],
         'other_symptoms': ['excessive_worry'],
+        'core_policy': 'all',
         'threshold': 3, # Both core symptoms must be present, plus general worry
         'explanation': 'A significant fear of being judged in social situations, leading to avoidance, is characteristic of Social Anxiety.'
     },
@@ -59,6 +64,7 @@ CONDITIONS = {
         'priority': 10,
         'core_symptoms': ['depressed_mood', 'loss_of_interest'],
         'other_symptoms': ['fatigue', 'sleep_disturbance'],
+        'core_policy': 'any',
         'threshold': 3,
         'explanation': 'Your responses show a pattern of low mood and loss of interest, which are key indicators of a depressive episode.'
     },
@@ -67,6 +73,7 @@ CONDITIONS = {
         'priority': 10,
         'core_symptoms': ['excessive_worry', 'restlessness'],
         'other_symptoms': ['fatigue', 'sleep_disturbance'],
+        'core_policy': 'any',
         'threshold': 3,
         'explanation': 'Your responses indicate persistent and excessive worry across various areas of life, which is a hallmark of GAD.'
     },
@@ -75,6 +82,7 @@ CONDITIONS = {
         'priority': 5, # Lower priority as it's situational
         'core_symptoms': ['fatigue', 'cynicism', 'professional_efficacy'],
         'other_symptoms': [],
+        'core_policy': 'any',
         'threshold': 2,
         'explanation': 'Your responses suggest a combination of exhaustion, cynicism, and a reduced sense of accomplishment, characteristic of burnout.'
     }
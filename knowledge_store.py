@@ -0,0 +1,411 @@
+# knowledge_store.py
+
+"""
+Externalized knowledge base with a compiled binary form and hot reload.
+
+Source files are JSON (or TOML on Python 3.11+) with the same structure as
+the dicts in knowledge_base.py plus a version number:
+
+    {"version": 2, "symptoms": {...}, "conditions": {...}, "interventions": {...}}
+
+A source is compiled once into `knowledge_base_<hash>.kb` in the model cache
+directory, named by a hash of the source file's bytes: loading an unchanged
+source only hashes it and maps the compiled file, without parsing or
+validating it again. Layout: 8-byte magic, 8-byte little-endian header
+length, a JSON header holding each string exactly once (symptom ids and
+questions, condition and intervention text), then 8-byte aligned arrays.
+Symptoms are interned as their position in the symptom table; condition
+symptom lists and intervention targets are stored as offset/id arrays, next
+to the precomputed threshold, priority, specificity and core policy of every
+condition, and the dense rule and target matrices the engine's batch paths
+read. Those matrices are used straight from a read-only np.memmap, so every
+process serving the same file shares one copy in the page cache.
+
+Set MINDFUL_KB_PATH to serve a source file instead of the built-in
+knowledge_base.py. The store checks the file every few seconds; a changed file
+is compiled on a background thread and swapped in as a new immutable
+snapshot. Requests hold on to the snapshot they started with, so a reload
+never blocks or alters them, and a file that fails to load is reported and
+ignored.
+
+Usage:
+    python knowledge_store.py export kb.json      # write the built-in knowledge base
+    python knowledge_store.py compile kb.json     # validate and compile a source file
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from knowledge_base import SYMPTOMS, CONDITIONS, INTERVENTIONS
+from inference_engine import (
+    CORE_POLICIES, CompiledRule, InterventionIndex, RuleNetwork,
+    INTERVENTION_INDEX, RULE_NETWORK, content_fingerprint,
+)
+from fuzzy_engine import MODEL_CACHE_DIR
+
+MAGIC = b'MINDKB02'
+POLICY_NAMES = list(CORE_POLICIES)
+# Symptom list fields replaced by interned id arrays in the compiled form
+CONDITION_LISTS = ('core_symptoms', 'other_symptoms')
+INTERVENTION_LISTS = ('target',)
+
+KnowledgeBase = namedtuple('KnowledgeBase', [
+    'version', 'fingerprint', 'symptoms', 'conditions', 'interventions', 'network', 'intervention_index',
+])
+
+BUILTIN = KnowledgeBase('builtin', RULE_NETWORK.fingerprint, SYMPTOMS, CONDITIONS, INTERVENTIONS,
+                        RULE_NETWORK, INTERVENTION_INDEX)
+
+
+# --- Source Files ---
+
+def parse_source(data, path):
+    """Parses and validates the bytes of a JSON/TOML source file; `path` picks the format."""
+    if path.lower().endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError("TOML knowledge bases need Python 3.11 or newer; use JSON instead.")
+        source = tomllib.loads(data.decode('utf-8'))
+    else:
+        source = json.loads(data.decode('utf-8'))
+    validate_source(source)
+    return source
+
+def read_source(path):
+    """Reads and validates a JSON/TOML knowledge base source file."""
+    with open(path, 'rb') as f:
+        return parse_source(f.read(), path)
+
+INT16_RANGE = (np.iinfo(np.int16).min, np.iinfo(np.int16).max)
+
+def _check_symptom_list(owner, field, values, symptoms):
+    if not isinstance(values, list) or not all(isinstance(s, str) for s in values):
+        raise ValueError(f"{owner} needs '{field}' as a list of symptom ids.")
+    unknown = [s for s in values if s not in symptoms]
+    if unknown:
+        raise ValueError(f"{owner} uses unknown symptoms in '{field}': {', '.join(unknown)}.")
+
+def validate_source(source):
+    """Raises ValueError for anything `compile_source` could not store."""
+    if not isinstance(source, dict) or not isinstance(source.get('version'), int):
+        raise ValueError("Knowledge base must be an object with an integer 'version'.")
+    for section in ('symptoms', 'conditions', 'interventions'):
+        if not isinstance(source.get(section), dict) or not source[section]:
+            raise ValueError(f"Knowledge base needs a non-empty '{section}' object.")
+
+    symptoms = source['symptoms']
+    if 'thoughts_of_harm' not in symptoms:
+        raise ValueError("The 'thoughts_of_harm' safety symptom is required.")
+    if 'SAFETY_CRITICAL' not in source['conditions']:
+        raise ValueError("The 'SAFETY_CRITICAL' condition is required.")
+    if 'Seek Immediate Help' not in source['interventions']:
+        raise ValueError("The 'Seek Immediate Help' intervention is required.")
+    bad_questions = [s for s, question in symptoms.items() if not isinstance(question, str)]
+    if bad_questions:
+        raise ValueError(f"Symptom questions must be strings: {', '.join(bad_questions)}.")
+
+    for condition_id, details in source['conditions'].items():
+        owner = f"Condition '{condition_id}'"
+        if not isinstance(details, dict):
+            raise ValueError(f"{owner} must be an object.")
+        missing = [f for f in ('name', 'priority', 'core_symptoms', 'threshold', 'explanation') if f not in details]
+        if missing:
+            raise ValueError(f"{owner} is missing {', '.join(missing)}.")
+        for field in ('priority', 'threshold'):
+            value = details[field]
+            # bool is an int subclass but never a meaningful priority or threshold
+            if not isinstance(value, int) or isinstance(value, bool) or not INT16_RANGE[0] <= value <= INT16_RANGE[1]:
+                raise ValueError(f"{owner} needs an integer '{field}' between {INT16_RANGE[0]} and {INT16_RANGE[1]}.")
+        policy = details.get('core_policy', 'any')
+        if not isinstance(policy, str) or policy not in CORE_POLICIES:
+            raise ValueError(f"Unknown core_policy '{policy}' for condition '{condition_id}'.")
+        for field in CONDITION_LISTS:
+            if field in details:
+                _check_symptom_list(owner, field, details[field], symptoms)
+
+    for name, details in source['interventions'].items():
+        owner = f"Intervention '{name}'"
+        if not isinstance(details, dict):
+            raise ValueError(f"{owner} must be an object.")
+        missing = [f for f in ('modality', 'target', 'description') if f not in details]
+        if missing:
+            raise ValueError(f"{owner} is missing {', '.join(missing)}.")
+        _check_symptom_list(owner, 'target', details['target'], symptoms)
+
+def export_source(path, version=1):
+    """Writes the built-in knowledge base as a JSON source file."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'symptoms': SYMPTOMS, 'conditions': CONDITIONS,
+                   'interventions': INTERVENTIONS}, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+
+
+# --- Compiled Form ---
+
+def _ragged(lists):
+    """Offsets and concatenated values for a list of integer lists."""
+    offsets = np.zeros(len(lists) + 1, dtype=np.int32)
+    offsets[1:] = np.cumsum([len(values) for values in lists])
+    return offsets, np.array([v for values in lists for v in values], dtype=np.int16)
+
+def compile_source(source, path):
+    """Writes the compiled form of a validated source to `path` atomically."""
+    symptom_ids = list(source['symptoms'])
+    interned = {s: i for i, s in enumerate(symptom_ids)}
+    conditions, interventions = source['conditions'], source['interventions']
+
+    core = [[interned[s] for s in d['core_symptoms']] for d in conditions.values()]
+    other = [[interned[s] for s in d.get('other_symptoms', [])] for d in conditions.values()]
+    arrays = {}
+    arrays['core_offsets'], arrays['core_ids'] = _ragged(core)
+    arrays['other_offsets'], arrays['other_ids'] = _ragged(other)
+    arrays['target_offsets'], arrays['target_ids'] = _ragged(
+        [[interned[s] for s in d['target']] for d in interventions.values()]
+    )
+    arrays['threshold'] = np.array([d['threshold'] for d in conditions.values()], dtype=np.int16)
+    arrays['priority'] = np.array([d['priority'] for d in conditions.values()], dtype=np.int16)
+    arrays['specificity'] = np.array([len(c) + len(o) for c, o in zip(core, other)], dtype=np.int16)
+    arrays['policy'] = np.array(
+        [POLICY_NAMES.index(d.get('core_policy', 'any')) for d in conditions.values()], dtype=np.uint8
+    )
+
+    # Dense matrices for RuleNetwork (rule conditions only, in order) and InterventionIndex
+    rule_rows = [i for i, d in enumerate(conditions.values()) if d['priority'] < 100]
+    for name, lists in (('core_matrix', core), ('other_matrix', other)):
+        matrix = np.zeros((len(rule_rows), len(symptom_ids)), dtype=bool)
+        for row, position in enumerate(rule_rows):
+            matrix[row, lists[position]] = True
+        arrays[name] = matrix
+    arrays['target_matrix'] = np.zeros((len(interventions), len(symptom_ids)), dtype=bool)
+    for row, d in enumerate(interventions.values()):
+        arrays['target_matrix'][row, [interned[s] for s in d['target']]] = True
+
+    # List fields keep their place in each record as a None placeholder
+    header = {
+        'version': source['version'],
+        'fingerprint': content_fingerprint(source),
+        'symptoms': source['symptoms'],
+        'conditions': {cid: {k: None if k in CONDITION_LISTS else v for k, v in d.items()}
+                       for cid, d in conditions.items()},
+        'interventions': {name: {k: None if k in INTERVENTION_LISTS else v for k, v in d.items()}
+                          for name, d in interventions.items()},
+        'policies': POLICY_NAMES,
+        'arrays': {},
+    }
+    offset = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = [offset, array.dtype.str, list(array.shape)]
+        offset += -(-array.nbytes // 8) * 8
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC + len(header_bytes).to_bytes(8, 'little') + header_bytes)
+            for array in arrays.values():
+                data = array.tobytes()
+                f.write(data + b'\0' * (-len(data) % 8))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def load_compiled(path):
+    """Maps a compiled knowledge base and builds an engine-ready snapshot from it."""
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    if bytes(mapped[:8]) != MAGIC:
+        raise ValueError(f"{path} is not a compiled knowledge base.")
+    header_length = int.from_bytes(bytes(mapped[8:16]), 'little')
+    header = json.loads(bytes(mapped[16:16 + header_length]))
+    data_start = 16 + header_length
+
+    # Read-only views into the mapping, which stays open as long as any of them is referenced
+    arrays = {}
+    for name, (offset, dtype, shape) in header['arrays'].items():
+        start = data_start + offset
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        arrays[name] = mapped[start:start + size].view(dtype).reshape(shape)
+
+    def ids(kind, position):
+        offsets = arrays[f'{kind}_offsets']
+        return arrays[f'{kind}_ids'][offsets[position]:offsets[position + 1]]
+
+    symptoms = header['symptoms']
+    symptom_ids = list(symptoms)
+    conditions, rules = {}, []
+    for position, (condition_id, details) in enumerate(header['conditions'].items()):
+        core_symptoms = tuple(symptom_ids[i] for i in ids('core', position))
+        other_symptoms = tuple(symptom_ids[i] for i in ids('other', position))
+        if 'core_symptoms' in details:
+            details['core_symptoms'] = list(core_symptoms)
+        if 'other_symptoms' in details:
+            details['other_symptoms'] = list(other_symptoms)
+        conditions[condition_id] = details
+
+        priority = int(arrays['priority'][position])
+        if priority >= 100:
+            continue
+        rules.append(CompiledRule(
+            condition_id=condition_id,
+            details=details,
+            core_symptoms=core_symptoms,
+            other_symptoms=other_symptoms,
+            core_mask=sum(1 << int(i) for i in set(ids('core', position))),
+            other_mask=sum(1 << int(i) for i in set(ids('other', position))),
+            core_total=len(core_symptoms),
+            policy=CORE_POLICIES[header['policies'][arrays['policy'][position]]],
+            threshold=int(arrays['threshold'][position]),
+            priority=priority,
+            specificity=int(arrays['specificity'][position]),
+        ))
+
+    interventions = {}
+    for position, (name, details) in enumerate(header['interventions'].items()):
+        details['target'] = [symptom_ids[i] for i in ids('target', position)]
+        interventions[name] = details
+
+    fingerprint = header['fingerprint']
+    return KnowledgeBase(
+        version=header['version'],
+        fingerprint=fingerprint,
+        symptoms=symptoms,
+        conditions=conditions,
+        interventions=interventions,
+        network=RuleNetwork(
+            symptoms, conditions, rules, fingerprint=content_fingerprint(fingerprint, 'rules'),
+            matrices=(arrays['core_matrix'], arrays['other_matrix']),
+        ),
+        intervention_index=InterventionIndex(
+            interventions, symptom_ids, arrays['target_matrix'],
+            fingerprint=content_fingerprint(fingerprint, 'interventions'),
+        ),
+    )
+
+def compiled_path(data, cache_dir=None):
+    """Where the compiled form of a source file with contents `data` is cached."""
+    return os.path.join(cache_dir or MODEL_CACHE_DIR, f"knowledge_base_{hashlib.sha256(data).hexdigest()[:16]}.kb")
+
+def load_knowledge_base(path, cache_dir=None):
+    """
+    Loads a source file through its compiled form. The source is only parsed,
+    validated and compiled when no compiled file matches its bytes.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    target = compiled_path(data, cache_dir)
+    if os.path.exists(target):
+        try:
+            return load_compiled(target)
+        except (ValueError, KeyError, IndexError):
+            pass  # damaged or from an older format: rebuild it
+    compile_source(parse_source(data, path), target)
+    return load_compiled(target)
+
+
+# --- Hot Reload ---
+
+class KnowledgeBaseStore:
+    """The knowledge base snapshot a process currently serves."""
+
+    def __init__(self, source_path=None, cache_dir=None, check_interval=2.0):
+        self.source_path = source_path
+        self.cache_dir = cache_dir
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        self.reloads = 0
+        self.next_check = 0.0
+        self.source_stat = None
+        self.current = BUILTIN
+        if source_path:
+            self.source_stat = self._stat()
+            self.current = load_knowledge_base(source_path, cache_dir)
+            self.next_check = time.monotonic() + check_interval
+
+    def _stat(self):
+        st = os.stat(self.source_path)
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def get(self):
+        """
+        The snapshot to use for one request; never waits on a reload. When a
+        check is due it runs on a background thread, at most one at a time,
+        and a changed source is swapped in once it has compiled.
+        """
+        if self.source_path and time.monotonic() >= self.next_check and self.lock.acquire(blocking=False):
+            self.next_check = time.monotonic() + self.check_interval
+            try:
+                threading.Thread(target=self._check, name='knowledge-base-reload', daemon=True).start()
+            except RuntimeError:
+                # Interpreter shutting down or out of threads: try again at the next check
+                self.lock.release()
+        return self.current
+
+    def _check(self):
+        try:
+            self._reload_if_changed()
+        finally:
+            self.next_check = time.monotonic() + self.check_interval
+            self.lock.release()
+
+    def _after_fork(self):
+        # A forked worker does not inherit the reload thread, so it must not inherit its lock either
+        self.lock = threading.Lock()
+
+    def _reload_if_changed(self):
+        try:
+            stat = self._stat()
+            if stat == self.source_stat:
+                return
+            # Recorded up front so a broken file is reported once, not on every check
+            self.source_stat = stat
+            knowledge_base = load_knowledge_base(self.source_path, self.cache_dir)
+        except Exception as e:
+            # Whatever is wrong with the file, keep serving the last good snapshot
+            print(f"Knowledge base reload error: {e}")
+            return
+        # A single reference swap: readers see either the old snapshot or the new one
+        self.current = knowledge_base
+        self.reloads += 1
+
+
+KNOWLEDGE_STORE = KnowledgeBaseStore(os.environ.get('MINDFUL_KB_PATH'))
+
+def current_knowledge_base():
+    return KNOWLEDGE_STORE.get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or compile Mindful AI Advisor knowledge bases.")
+    parser.add_argument('command', choices=['export', 'compile'])
+    parser.add_argument('path')
+    parser.add_argument('--version', type=int, default=1, help="Version number written by export.")
+    parser.add_argument('--cache-dir', help="Where compiled knowledge bases are stored.")
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_source(args.path, args.version)
+        print(f"Wrote {args.path}")
+    else:
+        with open(args.path, 'rb') as f:
+            data = f.read()
+        source = parse_source(data, args.path)
+        target = compiled_path(data, args.cache_dir)
+        compile_source(source, target)
+        print(f"Compiled version {source['version']} to {target} ({os.path.getsize(target):,} bytes)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# mamdani.py
+
+"""
+Mamdani inference over trapezoidal (trapmf) membership functions with exact
+centroid defuzzification.
+
+skfuzzy samples the output universe and integrates the clipped aggregate
+numerically, so its cost and accuracy both depend on the universe step. Here
+the aggregate max_k(min(cut_k, T_k(y))) is treated as the piecewise-linear
+function it is. Its kinks can only sit at trapezoid vertices, where a cut
+level meets a term's slope, or where two slopes cross, and all of these are
+known in closed form. Between consecutive kinks the aggregate is linear, so
+its area and moment have closed forms too. The result does not depend on
+any sampling resolution.
+
+Rules are (operator, [(variable, term), ...], output term), operator 'and'
+(min) or 'or' (max), as in fuzzy_engine.CONCERN_RULES. Variables can be any
+set of inputs, e.g. every key in SYMPTOMS. Only rules with a non-zero
+antecedent membership are evaluated: for a single assessment through an
+inverted index from each (variable, term) to its rules, for a batch by
+skipping rules whose antecedents are zero on every row.
+"""
+
+import numpy as np
+
+# Slope used for vertical trapezoid edges; `aggregate` is only sampled strictly inside segments
+VERTICAL_SLOPE = 1e300
+
+
+def _trapezoid(y, params):
+    """trapmf evaluated analytically; vertical shoulders (a == b or c == d) count as 1."""
+    a, b, c, d = params
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rising = np.where(y >= b, 1.0, np.where(y > a, (y - a) / (b - a), 0.0))
+        falling = np.where(y <= c, 1.0, np.where(y < d, (d - y) / (d - c), 0.0))
+    return np.minimum(rising, falling)
+
+def _trapezoid_value(x, params):
+    """Scalar `_trapezoid` for the single-assessment path."""
+    a, b, c, d = params
+    rising = 1.0 if x >= b else (x - a) / (b - a) if x > a else 0.0
+    falling = 1.0 if x <= c else (d - x) / (d - c) if x < d else 0.0
+    return min(rising, falling)
+
+
+class MamdaniSystem:
+    """
+    Trapezoidal Mamdani system. `inputs` maps each variable to the key it is
+    read from in `compute`'s user inputs (default: the variable name itself).
+    """
+
+    def __init__(self, input_terms, output_terms, rules, inputs=None, default=5.0, missing_value=5):
+        self.variables = list(input_terms)
+        self.inputs = inputs or {v: v for v in self.variables}
+        self.input_terms = input_terms
+        self.output_names = list(output_terms)
+        self.output_params = np.array([output_terms[t] for t in self.output_names], dtype=float)
+        self.default = default
+        self.missing_value = missing_value
+
+        # Inputs are clipped to each variable's support, like skfuzzy clips to its universe
+        self.input_range = {
+            v: (min(p[0] for p in terms.values()), max(p[3] for p in terms.values()))
+            for v, terms in input_terms.items()
+        }
+        self.output_range = (self.output_params[:, 0].min(), self.output_params[:, 3].max())
+        # Edge slopes for `aggregate`; a vertical edge gets a slope steep enough to act as a step
+        a, b, c, d = self.output_params.T
+        self.rising_slope = np.where(b > a, 1.0 / np.where(b > a, b - a, 1.0), VERTICAL_SLOPE)
+        self.falling_slope = np.where(d > c, 1.0 / np.where(d > c, d - c, 1.0), VERTICAL_SLOPE)
+
+        # Membership columns are (variable, term) pairs; rules refer to them by position
+        self.columns = [(v, t) for v in self.variables for t in input_terms[v]]
+        self.column_index = {c: i for i, c in enumerate(self.columns)}
+        self.rules = []
+        self.rules_by_column = {}
+        for operator, antecedents, consequent in rules:
+            if operator not in ('and', 'or'):
+                raise ValueError(f"Unknown rule operator '{operator}'.")
+            columns = [self.column_index[a] for a in antecedents]
+            position = len(self.rules)
+            self.rules.append((operator == 'and', columns, self.output_names.index(consequent)))
+            for column in set(columns):
+                self.rules_by_column.setdefault(column, []).append(position)
+
+        self.fixed_points = self._fixed_breakpoints()
+
+    def _fixed_breakpoints(self):
+        """Candidate kinks that do not depend on the cut levels: vertices and slope crossings."""
+        low, high = self.output_range
+        points = {low, high}
+        slopes = []  # (intercept, slope) of every sloped edge
+        for a, b, c, d in self.output_params:
+            points.update((a, b, c, d))
+            if b > a:
+                slopes.append((-a / (b - a), 1.0 / (b - a)))
+            if d > c:
+                slopes.append((d / (d - c), -1.0 / (d - c)))
+        for i, (q1, m1) in enumerate(slopes):
+            for q2, m2 in slopes[i + 1:]:
+                if m1 != m2:
+                    points.add((q2 - q1) / (m1 - m2))
+        return np.array(sorted(p for p in points if low <= p <= high))
+
+    # --- Fuzzification and Rule Evaluation ---
+
+    def memberships(self, inputs):
+        """(N, len(columns)) membership degrees for an (N, len(variables)) input array."""
+        inputs = np.asarray(inputs, dtype=float).reshape(-1, len(self.variables))
+        degrees = np.empty((len(inputs), len(self.columns)))
+        for i, (variable, term) in enumerate(self.columns):
+            low, high = self.input_range[variable]
+            x = np.clip(inputs[:, self.variables.index(variable)], low, high)
+            degrees[:, i] = _trapezoid(x, self.input_terms[variable][term])
+        return degrees
+
+    def cuts(self, degrees):
+        """(N, output terms) clip levels, skipping rules no row can fire."""
+        cuts = np.zeros((len(degrees), len(self.output_names)))
+        active = degrees.any(axis=0)
+        for is_and, columns, consequent in self.rules:
+            if is_and and not active[columns].all() or not is_and and not active[columns].any():
+                continue
+            antecedents = degrees[:, columns]
+            firing = antecedents.min(axis=1) if is_and else antecedents.max(axis=1)
+            np.maximum(cuts[:, consequent], firing, out=cuts[:, consequent])
+        return cuts
+
+    # --- Defuzzification ---
+
+    def aggregate(self, y, cuts):
+        """Clipped-aggregate output membership at points `y` (N, M) for cut levels (N, K)."""
+        a, _, _, d = self.output_params.T
+        y = y[:, :, None]
+        rising = np.clip((y - a) * self.rising_slope, 0.0, 1.0)
+        falling = np.clip((d - y) * self.falling_slope, 0.0, 1.0)
+        return np.minimum(np.minimum(rising, falling), cuts[:, None, :]).max(axis=2)
+
+    def centroid(self, cuts):
+        """Exact centroid of the clipped aggregate for each row of cut levels."""
+        cuts = np.asarray(cuts, dtype=float).reshape(-1, len(self.output_names))
+        low, high = self.output_range
+        a, b, c, d = self.output_params.T
+
+        # Where each cut level meets each term's rising and falling edge
+        level = cuts[:, :, None]
+        crossings = np.concatenate([
+            (a + level * (b - a)).reshape(len(cuts), -1),
+            (d - level * (d - c)).reshape(len(cuts), -1),
+        ], axis=1)
+        points = np.concatenate([np.broadcast_to(self.fixed_points, (len(cuts), len(self.fixed_points))),
+                                 np.clip(crossings, low, high)], axis=1)
+        points = np.sort(points, axis=1)
+
+        # The aggregate is linear on each segment, so two interior samples determine it
+        left, width = points[:, :-1], np.diff(points, axis=1)
+        first = self.aggregate(left + 0.25 * width, cuts)
+        third = self.aggregate(left + 0.75 * width, cuts)
+        area = width * (first + third) / 2
+        moment = area * (left + 0.5 * width) + (third - first) * width ** 2 / 6
+
+        total_area = area.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(total_area > 0, moment.sum(axis=1) / total_area, self.default)
+
+    # --- Entry Points ---
+
+    def evaluate(self, inputs):
+        """Scores an (N, len(variables)) array, columns ordered as `variables`."""
+        return self.centroid(self.cuts(self.memberships(inputs)))
+
+    def compute(self, user_inputs):
+        """Scores one assessment, visiting only rules reachable from non-zero memberships."""
+        degrees = {}
+        for variable in self.variables:
+            low, high = self.input_range[variable]
+            x = min(max(float(user_inputs.get(self.inputs[variable], self.missing_value)), low), high)
+            for term, params in self.input_terms[variable].items():
+                degree = _trapezoid_value(x, params)
+                if degree > 0.0:
+                    degrees[self.column_index[variable, term]] = degree
+
+        candidates = set()
+        for column in degrees:
+            candidates.update(self.rules_by_column.get(column, ()))
+
+        cuts = np.zeros(len(self.output_names))
+        for position in candidates:
+            is_and, columns, consequent = self.rules[position]
+            values = [degrees.get(column, 0.0) for column in columns]
+            firing = min(values) if is_and else max(values)
+            cuts[consequent] = max(cuts[consequent], firing)
+        return float(self.centroid(cuts)[0])
@@ -0,0 +1,141 @@
+# result_cache.py
+
+"""
+Process-wide LRU cache of analysis results.
+
+Sliders are integers, so many sessions submit the same symptom vector. Results
+are keyed by (symptom vector, frozenset of suggestion history, knowledge base
+version). The version covers the rule network, the intervention library and the
+fuzzy concern model, so an entry can never be served after any of them change.
+Cached values are analysis tuples (conditions, interventions, log, concern)
+as produced by InferenceEngine.run plus the concern score. Callers always get
+their own copy of the condition dicts and containers; intervention details are
+the knowledge base entries themselves, exactly as `run` returns them.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+
+from knowledge_base import SYMPTOMS
+from fuzzy_engine import model_fingerprint
+from inference_engine import content_fingerprint
+
+
+_versions = {}
+
+def analysis_version(engine):
+    """Version of everything an engine's result depends on."""
+    parts = (engine.network.fingerprint, engine.intervention_index.fingerprint)
+    if parts not in _versions:
+        _versions[parts] = content_fingerprint(*parts, model_fingerprint())
+    return _versions[parts]
+
+def _copy_analysis(analysis):
+    conditions, interventions, log, concern = analysis
+    copied = []
+    for condition in conditions:
+        condition = dict(condition)
+        for field, value in condition.items():
+            if isinstance(value, list):
+                condition[field] = list(value)
+        copied.append(condition)
+    return copied, dict(interventions), list(log), concern
+
+def _approximate_size(analysis):
+    conditions, interventions, log, _ = analysis
+    size = sys.getsizeof(analysis) + sys.getsizeof(conditions) + sys.getsizeof(interventions) + sys.getsizeof(log)
+    for condition in conditions:
+        size += sys.getsizeof(condition) + sum(sys.getsizeof(v) for v in condition.values())
+    # Intervention details are shared knowledge base entries; only the names are owned here
+    size += sum(sys.getsizeof(name) for name in interventions)
+    size += sum(sys.getsizeof(entry) for entry in log)
+    return size
+
+
+class ResultCache:
+    """Thread-safe LRU cache bounded by entry count and approximate memory."""
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.total_bytes = 0
+        self.version = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(symptom_inputs, suggestion_history, version, symptom_ids=SYMPTOMS):
+        """Cache key, or None when an input is not on the integer slider grid."""
+        vector = []
+        for s in symptom_ids:
+            value = symptom_inputs.get(s, 0)
+            if value != int(value):
+                return None
+            vector.append(int(value))
+        return tuple(vector), frozenset(suggestion_history or ()), version
+
+    def get(self, key):
+        with self.lock:
+            if key is None or key[2] != self.version or key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            value = self.entries[key][0]
+        return _copy_analysis(value)
+
+    def put(self, key, value):
+        if key is None:
+            return
+        value = _copy_analysis(value)
+        size = _approximate_size(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key[2] != self.version:
+                # Knowledge base changed: nothing cached under the old version may be served again
+                if self.entries:
+                    self.invalidations += 1
+                self.entries.clear()
+                self.total_bytes = 0
+                self.version = key[2]
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, symptom_inputs, suggestion_history, version, compute, symptom_ids=SYMPTOMS):
+        """Returns the cached result for these inputs, calling `compute()` on a miss."""
+        key = self.make_key(symptom_inputs, suggestion_history, version, symptom_ids)
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
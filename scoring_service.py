@@ -0,0 +1,351 @@
+# scoring_service.py
+
+"""
+Headless JSON scoring service, independent of the Streamlit UI.
+
+Endpoints:
+    POST /score        {"symptoms": {...}, "suggestion_history": [...]}
+    POST /score/batch  {"assessments": [{"symptoms": {...}, ...}, ...]}
+    GET  /health       status and metrics
+
+Symptoms left out of an assessment count as 0 (not present) for the rule
+engine. For the fuzzy concern score a missing mood, interest or worry input
+counts as 5, the neutral value calculate_concern_level uses in the app, so
+leaving one out does not read as an extreme answer.
+
+Scoring runs in a process pool so the event loop never blocks. Single
+requests are coalesced into micro-batches before being sent to a worker.
+Set MINDFUL_METRICS_DIR to have every worker export per-stage timings in
+Prometheus text format (see instrumentation.py).
+
+Usage:
+    python scoring_service.py --port 8080 --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from inference_engine import InferenceEngine
+from fuzzy_engine import CONCERN_INPUTS, load_concern_system
+from result_cache import ResultCache, analysis_version
+from knowledge_store import current_knowledge_base
+
+# Largest request body read; a batch of several thousand assessments fits comfortably
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+# --- Worker Process State ---
+# Loaded once per worker by `_init_worker` rather than once per request.
+_worker_fuzzy_system = None
+_worker_cache = None
+
+def _init_worker():
+    global _worker_fuzzy_system, _worker_cache
+    _worker_fuzzy_system = load_concern_system()
+    _worker_cache = ResultCache()
+
+def _score_many(assessments):
+    """Scores a list of validated assessments inside a worker process."""
+    if _worker_fuzzy_system is None:
+        _init_worker()
+
+    # The whole job is scored against one knowledge base snapshot, even if a reload lands meanwhile
+    kb = current_knowledge_base()
+    version = analysis_version(InferenceEngine(kb.network, kb.intervention_index))
+    symptom_ids = kb.network.symptom_ids
+
+    results = [None] * len(assessments)
+    keys = [
+        # The key holds missing symptoms as 0, so it cannot stand for a missing (neutral 5) concern input
+        ResultCache.make_key(a['symptoms'], a['suggestion_history'], version, symptom_ids)
+        if a['concern_inputs'] == [a['symptoms'].get(s, 0) for s in CONCERN_INPUTS.values()] else None
+        for a in assessments
+    ]
+    misses = []
+    for i, key in enumerate(keys):
+        results[i] = _worker_cache.get(key)
+        if results[i] is None:
+            misses.append(i)
+
+    concern = _worker_fuzzy_system.evaluate([assessments[i]['concern_inputs'] for i in misses])
+
+    for i, concern_level in zip(misses, concern):
+        engine = InferenceEngine(kb.network, kb.intervention_index)
+        for symptom_id, value in assessments[i]['symptoms'].items():
+            engine.add_fact(symptom_id, value)
+        conditions, interventions, log = engine.run(assessments[i]['suggestion_history'])
+        results[i] = (conditions, interventions, log, float(concern_level))
+        _worker_cache.put(keys[i], results[i])
+
+    return [
+        {"conditions": conditions, "interventions": interventions, "log": [str(entry) for entry in log], "concern": concern}
+        for conditions, interventions, log, concern in results
+    ]
+
+
+def _worker_context():
+    # Forked workers would inherit the client sockets open at that moment and keep them
+    # from closing, so Connection: close responses never reached EOF
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class RequestError(Exception):
+    """Raised for malformed requests; reported to the client as HTTP 400."""
+
+
+def validate_assessment(payload, known_symptoms=None):
+    """
+    Checks an assessment against the served symptoms and returns its
+    normalized form: every symptom (0 when left out), the concern model's
+    inputs in CONCERN_INPUTS order (5 when left out) and the history.
+    """
+    if known_symptoms is None:
+        known_symptoms = current_knowledge_base().symptoms
+    if not isinstance(payload, dict):
+        raise RequestError("Each assessment must be a JSON object.")
+    symptoms = payload.get('symptoms')
+    if not isinstance(symptoms, dict):
+        raise RequestError("'symptoms' must be an object mapping symptom ids to 0-10 scores.")
+
+    unknown = [s for s in symptoms if s not in known_symptoms]
+    if unknown:
+        raise RequestError(f"Unknown symptoms: {', '.join(sorted(unknown))}.")
+    for symptom_id, value in symptoms.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 10:
+            raise RequestError(f"Score for '{symptom_id}' must be a number between 0 and 10.")
+
+    history = payload.get('suggestion_history', [])
+    if not isinstance(history, list) or not all(isinstance(h, str) for h in history):
+        raise RequestError("'suggestion_history' must be a list of intervention names.")
+
+    return {
+        'symptoms': {s: symptoms.get(s, 0) for s in known_symptoms},
+        'concern_inputs': [symptoms.get(s, 5) for s in CONCERN_INPUTS.values()],
+        'suggestion_history': history,
+    }
+
+def _assessment_key(assessment):
+    return (
+        tuple(assessment['symptoms'].items()),
+        tuple(assessment['concern_inputs']),
+        tuple(assessment['suggestion_history']),
+    )
+
+
+class ScoringService:
+    """Micro-batching front end over a process pool of scoring workers."""
+
+    def __init__(self, workers=None, max_batch_size=64, max_batch_delay=0.005):
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=_worker_context(), initializer=_init_worker)
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self.queue = None
+        self.batcher = None
+        self.in_flight = set()
+        self.started = time.time()
+        self.metrics = {
+            'requests_total': 0,
+            'request_errors': 0,
+            'assessments_scored': 0,
+            'batches_dispatched': 0,
+            'coalesced_assessments': 0,
+            'scoring_seconds_total': 0.0,
+        }
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.batcher = asyncio.create_task(self._batch_loop())
+
+    async def close(self):
+        if self.batcher:
+            self.batcher.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def score(self, assessment):
+        """Queues one assessment for the next micro-batch and waits for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((assessment, future))
+        return await future
+
+    async def score_batch(self, assessments):
+        """Scores a client-supplied batch directly as one worker job."""
+        return await self._dispatch(assessments)
+
+    async def _dispatch(self, assessments):
+        # Identical assessments within a batch are scored once
+        unique, positions = {}, []
+        for assessment in assessments:
+            key = _assessment_key(assessment)
+            if key not in unique:
+                unique[key] = assessment
+            positions.append(key)
+        self.metrics['coalesced_assessments'] += len(assessments) - len(unique)
+
+        start = time.perf_counter()
+        keys = list(unique)
+        loop = asyncio.get_running_loop()
+        scored = await loop.run_in_executor(self.executor, _score_many, [unique[k] for k in keys])
+        self.metrics['scoring_seconds_total'] += time.perf_counter() - start
+        self.metrics['batches_dispatched'] += 1
+        self.metrics['assessments_scored'] += len(assessments)
+
+        by_key = dict(zip(keys, scored))
+        return [by_key[key] for key in positions]
+
+    async def _batch_loop(self):
+        while True:
+            pending = [await self.queue.get()]
+            deadline = time.monotonic() + self.max_batch_delay
+            while len(pending) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._resolve(pending))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    async def _resolve(self, pending):
+        try:
+            results = await self._dispatch([assessment for assessment, _ in pending])
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
+
+    def health(self):
+        metrics = dict(self.metrics)
+        batches = metrics['batches_dispatched']
+        metrics['mean_batch_size'] = metrics['assessments_scored'] / batches if batches else 0.0
+        metrics['queue_depth'] = self.queue.qsize() if self.queue else 0
+        metrics['uptime_seconds'] = time.time() - self.started
+        kb = current_knowledge_base()
+        return {'status': 'ok', 'knowledge_base': {'version': kb.version, 'fingerprint': kb.fingerprint[:16]},
+                'metrics': metrics}
+
+    # --- HTTP Handling ---
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    await self._write_response(writer, 400, {'error': 'Malformed request line.'}, close=True)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                # Without a usable length the body cannot be framed, so the connection is closed
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._write_response(writer, 400, {'error': 'Invalid Content-Length.'}, close=True)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._write_response(
+                        writer, 413, {'error': f'Request body is limited to {MAX_BODY_BYTES:,} bytes.'}, close=True
+                    )
+                    break
+                body = await reader.readexactly(length)
+                close = headers.get('connection', '').lower() == 'close'
+                status, payload = await self._route(method, path.split('?', 1)[0], body)
+                await self._write_response(writer, status, payload, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body):
+        self.metrics['requests_total'] += 1
+        try:
+            if method == 'GET' and path == '/health':
+                return 200, self.health()
+            if method == 'POST' and path == '/score':
+                return 200, await self.score(validate_assessment(_parse_json(body)))
+            if method == 'POST' and path == '/score/batch':
+                payload = _parse_json(body)
+                if not isinstance(payload, dict) or not isinstance(payload.get('assessments'), list):
+                    raise RequestError("'assessments' must be a list.")
+                assessments = [validate_assessment(a) for a in payload['assessments']]
+                return 200, {'results': await self.score_batch(assessments) if assessments else []}
+            return 404, {'error': f'No route for {method} {path}.'}
+        except RequestError as e:
+            self.metrics['request_errors'] += 1
+            return 400, {'error': str(e)}
+        except Exception as e:
+            self.metrics['request_errors'] += 1
+            print(f"Scoring error: {e}")
+            return 500, {'error': 'Internal scoring error.'}
+
+    async def _write_response(self, writer, status, payload, close=False):
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+                  500: 'Internal Server Error'}[status]
+        body = json.dumps(payload).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+def _parse_json(body):
+    try:
+        return json.loads(body or b'null')
+    except ValueError:
+        raise RequestError("Request body must be valid JSON.")
+
+
+async def serve(host='127.0.0.1', port=8080, workers=None, max_batch_size=64, max_batch_delay=0.005):
+    service = ScoringService(workers, max_batch_size, max_batch_delay)
+    await service.start()
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Scoring service listening on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless JSON scoring service for the Mindful AI Advisor.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-batch-delay-ms', type=float, default=5.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_batch_size, args.max_batch_delay_ms / 1000))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
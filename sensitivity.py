@@ -0,0 +1,155 @@
+# sensitivity.py
+
+"""
+What-if sensitivity explorer for one assessment.
+
+Every one-slider change (each symptom set to each value 0-10) and every
+two-slider change (each pair of symptoms at each combination of values) of
+the current inputs is scored in a single batch. Conditions come from
+InferenceEngine.select_batch and concern scores from the compiled concern
+system's table lookups. From that grid the explorer reports decision
+boundaries: the slider values at which the selected condition or the concern
+band flips, and the smallest changes that alter either outcome.
+
+The concern band is the concern term ('low', 'moderate', 'high') with the
+highest membership at the crisp score. The safety question is held at its
+current value, since it short-circuits the analysis rather than being a
+what-if.
+"""
+
+import itertools
+import time
+
+import numpy as np
+from fuzzy_engine import CONCERN_INPUTS, MEMBERSHIP_FUNCTIONS, _trapmf, calculate_concern_levels
+
+SLIDER_VALUES = np.arange(0, 11)
+FIXED_SYMPTOMS = ('thoughts_of_harm',)
+CONCERN_BANDS = list(MEMBERSHIP_FUNCTIONS['concern'])
+
+
+def concern_band(scores):
+    """Index into CONCERN_BANDS of the dominant concern term for each score."""
+    scores = np.asarray(scores, dtype=float)
+    return np.array([_trapmf(scores, params) for params in MEMBERSHIP_FUNCTIONS['concern'].values()]).argmax(axis=0)
+
+
+def perturbation_grid(base, varied):
+    """
+    Symptom matrix of all one- and two-slider changes of `base` over the
+    column positions in `varied`, with the (column, value) pairs applied.
+    """
+    count, levels = len(varied), len(SLIDER_VALUES)
+
+    single_columns = np.repeat(varied, levels)
+    single_values = np.tile(SLIDER_VALUES, count)
+    singles = np.tile(base, (len(single_columns), 1))
+    singles[np.arange(len(singles)), single_columns] = single_values
+
+    pairs = np.array(list(itertools.combinations(varied, 2))).reshape(-1, 2)
+    first_values, second_values = [v.ravel() for v in np.meshgrid(SLIDER_VALUES, SLIDER_VALUES, indexing='ij')]
+    pair_columns = np.repeat(pairs, levels * levels, axis=0)
+    pair_values = np.column_stack([np.tile(first_values, len(pairs)), np.tile(second_values, len(pairs))])
+    doubles = np.tile(base, (len(pair_columns), 1))
+    rows = np.arange(len(doubles))
+    doubles[rows, pair_columns[:, 0]] = pair_values[:, 0]
+    doubles[rows, pair_columns[:, 1]] = pair_values[:, 1]
+
+    return np.vstack([base[None, :], singles, doubles]), (single_columns, single_values), (pair_columns, pair_values)
+
+def _outcomes(engine, concern_system, matrix):
+    """Condition id and concern score for every row of a symptom matrix."""
+    network = engine.network
+    _, safety, best, _, _ = engine.select_batch(matrix)
+    ids = np.array([rule.condition_id for rule in network.rules] + [None, 'SAFETY_CRITICAL'], dtype=object)
+    codes = np.where(safety, len(network.rules) + 1, np.where(best >= 0, best, len(network.rules)))
+
+    position = {s: i for i, s in enumerate(network.symptom_ids)}
+    concern_inputs = np.column_stack([
+        matrix[:, position[s]] if s in position else np.full(len(matrix), 5) for s in CONCERN_INPUTS.values()
+    ])
+    return ids[codes], np.asarray(calculate_concern_levels(concern_system, concern_inputs), dtype=float)
+
+
+def explore(engine, concern_system, symptom_inputs, limit=5):
+    """
+    Sensitivity report for `symptom_inputs`: baseline outcome, one-slider
+    boundaries per symptom and the smallest one- or two-slider changes that
+    flip the condition or the concern band (at most `limit` each, one per
+    slider or pair of sliders).
+    """
+    started = time.perf_counter()
+    symptom_ids = engine.network.symptom_ids
+    base = np.array([int(round(symptom_inputs.get(s, 0))) for s in symptom_ids])
+    varied = [i for i, s in enumerate(symptom_ids) if s not in FIXED_SYMPTOMS]
+
+    matrix, (single_columns, single_values), (pair_columns, pair_values) = perturbation_grid(base, varied)
+    conditions, concern = _outcomes(engine, concern_system, matrix)
+    bands = concern_band(concern)
+
+    base_condition, base_band = conditions[0], bands[0]
+    singles = slice(1, 1 + len(single_columns))
+    doubles = slice(1 + len(single_columns), len(matrix))
+
+    # --- One-slider boundaries: where the outcome differs between neighbouring values ---
+    levels = len(SLIDER_VALUES)
+    single_conditions = conditions[singles].reshape(len(varied), levels)
+    single_bands = bands[singles].reshape(len(varied), levels)
+    single_concern = concern[singles].reshape(len(varied), levels)
+    boundaries = []
+    for row, column in enumerate(varied):
+        for value in range(levels - 1):
+            condition_flip = single_conditions[row, value] != single_conditions[row, value + 1]
+            band_flip = single_bands[row, value] != single_bands[row, value + 1]
+            if condition_flip or band_flip:
+                boundaries.append({
+                    'symptom': symptom_ids[column],
+                    'between': (int(SLIDER_VALUES[value]), int(SLIDER_VALUES[value + 1])),
+                    'condition': (single_conditions[row, value], single_conditions[row, value + 1]),
+                    'band': (CONCERN_BANDS[single_bands[row, value]], CONCERN_BANDS[single_bands[row, value + 1]]),
+                })
+
+    # --- Smallest changes that flip each outcome ---
+    # A two-slider change only counts when neither of its slider moves flips the outcome alone
+    slot = {column: row for row, column in enumerate(varied)}
+    first_slot = np.array([slot[c] for c in pair_columns[:, 0]], dtype=int).reshape(-1)
+    second_slot = np.array([slot[c] for c in pair_columns[:, 1]], dtype=int).reshape(-1)
+    single_distance = np.abs(single_values - base[single_columns])
+    pair_distance = (np.abs(pair_values[:, 0] - base[pair_columns[:, 0]])
+                     + np.abs(pair_values[:, 1] - base[pair_columns[:, 1]]))
+
+    def closest(outcome, single_outcome, baseline, describe):
+        single_flips = outcome[singles] != baseline
+        joint_flips = (
+            (outcome[doubles] != baseline)
+            & (single_outcome[first_slot, pair_values[:, 0]] == baseline)
+            & (single_outcome[second_slot, pair_values[:, 1]] == baseline)
+        )
+        found = []
+        for i in np.flatnonzero(single_flips):
+            found.append((int(single_distance[i]), [(symptom_ids[single_columns[i]], int(single_values[i]))],
+                          describe(1 + i)))
+        for i in np.flatnonzero(joint_flips):
+            found.append((int(pair_distance[i]),
+                          [(symptom_ids[c], int(v)) for c, v in zip(pair_columns[i], pair_values[i])],
+                          describe(1 + len(single_columns) + i)))
+        found.sort(key=lambda f: f[0])
+        flips, moved = [], set()
+        for distance, changes, result in found:
+            # Only the smallest change of each slider or pair of sliders is reported
+            sliders = tuple(s for s, _ in changes)
+            if sliders not in moved and len(flips) < limit:
+                moved.add(sliders)
+                flips.append({'distance': distance, 'changes': changes, 'result': result})
+        return flips
+
+    return {
+        'baseline': {'condition': base_condition, 'band': CONCERN_BANDS[base_band], 'concern': float(concern[0])},
+        'boundaries': boundaries,
+        'condition_flips': closest(conditions, single_conditions, base_condition, lambda i: conditions[i]),
+        'band_flips': closest(bands, single_bands, base_band,
+                              lambda i: {'band': CONCERN_BANDS[bands[i]], 'concern': float(concern[i])}),
+        'single_concern': {symptom_ids[column]: single_concern[row].tolist() for row, column in enumerate(varied)},
+        'variants': len(matrix) - 1,
+        'seconds': time.perf_counter() - started,
+    }
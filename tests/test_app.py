@@ -0,0 +1,51 @@
+# tests/test_app.py
+
+import json
+import os
+import time
+
+import pytest
+
+import knowledge_store
+from knowledge_store import KnowledgeBaseStore, export_source
+
+pytest.importorskip('streamlit')
+from streamlit.testing.v1 import AppTest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+def wait_for_version(store, version, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while store.get().version != version:
+        assert time.monotonic() < deadline, "knowledge base was not reloaded"
+        time.sleep(0.01)
+
+
+def test_knowledge_base_reload_drops_stale_results(tmp_path, monkeypatch):
+    source = tmp_path / 'kb.json'
+    export_source(str(source))
+    store = KnowledgeBaseStore(str(source), str(tmp_path / 'cache'), check_interval=0)
+    monkeypatch.setattr(knowledge_store, 'KNOWLEDGE_STORE', store)
+
+    at = AppTest.from_file(APP, default_timeout=60).run()
+    for symptom_id in ('depressed_mood', 'loss_of_interest', 'fatigue'):
+        at.slider(key=symptom_id).set_value(8).run()
+    at.button[0].click().run()
+    assert not at.exception
+    assert any(e.label == "What-if Sensitivity" for e in at.expander)
+
+    kb = json.loads(source.read_text(encoding='utf-8'))
+    kb['version'] = 2
+    kb['conditions']['MDD']['name'] = "Reloaded Depression Pattern"
+    source.write_text(json.dumps(kb), encoding='utf-8')
+    wait_for_version(store, 2)
+
+    # Results from the old knowledge base are dropped instead of being explored against the new one
+    at.run()
+    assert not at.exception
+    assert not any(e.label == "What-if Sensitivity" for e in at.expander)
+
+    at.button[0].click().run()
+    assert not at.exception
+    assert "#### Reloaded Depression Pattern" in [m.value for m in at.markdown]
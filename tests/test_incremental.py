@@ -0,0 +1,51 @@
+# tests/test_incremental.py
+
+import random
+
+import pytest
+
+from inference_engine import INTERVENTION_INDEX, RULE_NETWORK, InferenceEngine
+
+SYMPTOM_IDS = RULE_NETWORK.symptom_ids
+INTERVENTION_NAMES = list(INTERVENTION_INDEX.interventions)
+
+
+def analysis(engine, history):
+    conditions, interventions, log = engine.run(history)
+    return conditions, interventions, [str(entry) for entry in log]
+
+def full_run(facts, history):
+    engine = InferenceEngine(RULE_NETWORK, INTERVENTION_INDEX)
+    for symptom_id, value in facts.items():
+        engine.add_fact(symptom_id, value)
+    return analysis(engine, history)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_single_slider_updates_match_full_run(seed):
+    rng = random.Random(seed)
+    engine = InferenceEngine(RULE_NETWORK, INTERVENTION_INDEX, incremental=True)
+    facts = {s: rng.randint(0, 10) for s in SYMPTOM_IDS}
+    for symptom_id, value in facts.items():
+        engine.add_fact(symptom_id, value)
+
+    for _ in range(2000):
+        symptom_id = rng.choice(SYMPTOM_IDS)
+        # Mostly moves across the presence threshold at 5, where match states flip
+        value = rng.choice([4, 5]) if rng.random() < 0.5 else rng.randint(0, 10)
+        if symptom_id == 'thoughts_of_harm' and rng.random() < 0.8:
+            value = rng.randint(0, 4)
+        facts[symptom_id] = value
+        engine.add_fact(symptom_id, value)
+
+        history = rng.sample(INTERVENTION_NAMES, rng.randint(0, 4))
+        assert analysis(engine, history) == full_run(facts, history)
+
+def test_repeated_runs_without_updates_are_stable():
+    engine = InferenceEngine(RULE_NETWORK, INTERVENTION_INDEX, incremental=True)
+    facts = {s: 7 for s in SYMPTOM_IDS}
+    facts['thoughts_of_harm'] = 0
+    for symptom_id, value in facts.items():
+        engine.add_fact(symptom_id, value)
+    first = analysis(engine, [])
+    assert analysis(engine, []) == first == full_run(facts, [])
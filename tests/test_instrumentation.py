@@ -0,0 +1,40 @@
+# tests/test_instrumentation.py
+
+import os
+import threading
+import time
+
+from instrumentation import StageMetrics
+
+
+def hammer(metrics, threads=8, calls=500):
+    start = threading.Barrier(threads)
+
+    def record():
+        start.wait()
+        for _ in range(calls):
+            metrics('score', 0.001)
+
+    workers = [threading.Thread(target=record) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def test_one_export_per_interval(tmp_path, monkeypatch):
+    metrics = StageMetrics(export_path=str(tmp_path / 'stages.prom'), export_interval=3600)
+    metrics.last_export = time.monotonic() - 3600
+    exports = []
+    monkeypatch.setattr(metrics, '_export', lambda path: exports.append(path))
+    hammer(metrics)
+    assert len(exports) == 1
+    assert metrics.counts['score'] == 8 * 500
+
+def test_concurrent_exports_use_separate_temp_files(tmp_path, capsys):
+    path = tmp_path / 'stages.prom'
+    metrics = StageMetrics(export_path=str(path), export_interval=0)
+    hammer(metrics, calls=50)
+    assert "Could not write stage metrics" not in capsys.readouterr().out
+    assert 'mindful_stage_duration_seconds_count{stage="score"}' in path.read_text()
+    assert os.listdir(tmp_path) == ['stages.prom']
@@ -0,0 +1,46 @@
+# tests/test_intervention_index.py
+
+import random
+
+import pytest
+
+from inference_engine import INTERVENTION_INDEX, SYMPTOM_IDS
+from knowledge_base import INTERVENTIONS
+
+INTERVENTION_NAMES = list(INTERVENTIONS)
+
+
+def greedy_interventions(symptoms, history, k):
+    """Intervention selection as written before the index: k passes over INTERVENTIONS."""
+    suggestions = {}
+    for _ in range(k):
+        best_suggestion = None
+        highest_relevance = -1
+
+        for name, details in INTERVENTIONS.items():
+            if name in history or name in suggestions or name == "Seek Immediate Help":
+                continue
+
+            relevance = len(set(details['target']) & set(symptoms))
+            if relevance > highest_relevance:
+                highest_relevance = relevance
+                best_suggestion = {name: details}
+
+        if best_suggestion:
+            suggestions.update(best_suggestion)
+        else:
+            break
+    return suggestions
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_top_k_matches_greedy_loop(seed):
+    rng = random.Random(seed)
+    for _ in range(2000):
+        symptoms = set(rng.sample(SYMPTOM_IDS, rng.randint(0, len(SYMPTOM_IDS))))
+        history = rng.sample(INTERVENTION_NAMES, rng.randint(0, len(INTERVENTION_NAMES)))
+        k = rng.randint(0, len(INTERVENTION_NAMES) + 1)
+        expected = greedy_interventions(symptoms, history, k)
+        result = INTERVENTION_INDEX.top_k(symptoms, history, k)
+        assert result == expected
+        assert list(result) == list(expected)
@@ -0,0 +1,47 @@
+# tests/test_mamdani.py
+
+import contextlib
+import io
+import itertools
+
+import numpy as np
+import pytest
+
+from fuzzy_engine import (
+    CONCERN_INPUTS, DEFAULT_CONCERN, UNIVERSE,
+    calculate_concern_level, compile_concern_system, create_analytic_concern_system, create_fuzzy_control_system,
+)
+
+pytest.importorskip('skfuzzy')
+
+INTEGER_GRID = np.array(list(itertools.product(UNIVERSE, repeat=len(CONCERN_INPUTS))), dtype=float)
+RANDOM_INPUTS = np.random.default_rng(0).uniform(UNIVERSE.min(), UNIVERSE.max(), (60, len(CONCERN_INPUTS)))
+
+
+def skfuzzy_scores(simulation, rows):
+    """skfuzzy concern scores, DEFAULT_CONCERN where no rule fires (as in calculate_concern_level)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return np.array([
+            calculate_concern_level(simulation, dict(zip(CONCERN_INPUTS.values(), row))) for row in rows
+        ])
+
+
+def test_analytic_matches_fine_skfuzzy():
+    # The exact centroid is the limit skfuzzy approaches as its universe step shrinks
+    simulation = create_fuzzy_control_system(np.arange(0, 10.0005, 0.001))
+    rows = np.vstack([RANDOM_INPUTS, INTEGER_GRID[::37]])
+    expected = skfuzzy_scores(simulation, rows)
+    np.testing.assert_allclose(create_analytic_concern_system().evaluate(rows), expected, rtol=0, atol=1e-6)
+
+def test_analytic_compute_matches_evaluate():
+    system = create_analytic_concern_system()
+    for rows, cast in ((RANDOM_INPUTS, float), (INTEGER_GRID, int)):
+        batch = system.evaluate(rows)
+        single = [system.compute({s: cast(v) for s, v in zip(CONCERN_INPUTS.values(), row)}) for row in rows]
+        np.testing.assert_allclose(single, batch, rtol=0, atol=1e-12)
+
+def test_compiled_system_matches_skfuzzy_exactly():
+    expected = skfuzzy_scores(create_fuzzy_control_system(), INTEGER_GRID)
+    compiled = compile_concern_system()
+    np.testing.assert_array_equal(compiled.evaluate(INTEGER_GRID), expected)
+    assert DEFAULT_CONCERN in expected  # the no-rule-fires fallback is covered too
@@ -0,0 +1,97 @@
+# tests/test_rule_network.py
+
+import random
+
+import pytest
+
+from inference_engine import INTERVENTION_INDEX, RULE_NETWORK, InferenceEngine
+from knowledge_base import CONDITIONS
+
+SYMPTOM_IDS = RULE_NETWORK.symptom_ids
+
+
+def hard_coded_match(facts):
+    """Condition matching as written before the rule network: core checks per condition id."""
+    log = []
+    present_symptoms = {s for s, v in facts.items() if v >= 5}
+
+    if 'thoughts_of_harm' in present_symptoms:
+        log.append("Safety-critical rule triggered. Halting further analysis.")
+        safety_rule = CONDITIONS['SAFETY_CRITICAL'].copy()
+        safety_rule['id'] = 'SAFETY_CRITICAL'
+        return [safety_rule], log
+
+    potential_conditions = []
+    for condition_id, details in CONDITIONS.items():
+        if details.get('priority', 0) >= 100:
+            continue
+
+        core_symptoms_present = [s for s in details['core_symptoms'] if s in present_symptoms]
+
+        core_condition_met = False
+        if condition_id in ['MDD', 'GAD'] and len(core_symptoms_present) >= 1:
+            core_condition_met = True
+        elif condition_id in ['PanicDisorder', 'SocialAnxiety'] and len(core_symptoms_present) == len(details['core_symptoms']):
+            core_condition_met = True
+        elif condition_id == 'Burnout' and len(core_symptoms_present) >= 1:
+            core_condition_met = True
+
+        if core_condition_met:
+            other_symptoms_present = [s for s in details.get('other_symptoms', []) if s in present_symptoms]
+            total_symptoms_matched = len(core_symptoms_present) + len(other_symptoms_present)
+
+            if total_symptoms_matched >= details['threshold']:
+                num_defined_symptoms = len(details['core_symptoms']) + len(details.get('other_symptoms', []))
+                specificity_score = num_defined_symptoms
+                match_score = (total_symptoms_matched / num_defined_symptoms) * 100 if num_defined_symptoms > 0 else 0
+
+                condition_data = details.copy()
+                condition_data['id'] = condition_id
+                condition_data['symptoms_matched'] = core_symptoms_present + other_symptoms_present
+                condition_data['specificity'] = specificity_score
+                condition_data['match'] = match_score
+
+                potential_conditions.append(condition_data)
+                log.append(f"Rule '{details['name']}' considered. Specificity: {specificity_score}, Match: {match_score:.0f}%.")
+
+    if not potential_conditions:
+        return [], log
+
+    best_condition = sorted(
+        potential_conditions,
+        key=lambda x: (x['priority'], x['specificity'], x['match']),
+        reverse=True
+    )[0]
+    log.append(f"**Conflict Resolution: '{best_condition['name']}' selected as best fit.**")
+    return [best_condition], log
+
+def network_match(facts):
+    engine = InferenceEngine(RULE_NETWORK, INTERVENTION_INDEX)
+    for symptom_id, value in facts.items():
+        engine.add_fact(symptom_id, value)
+    conditions, _, log = engine.run()
+    return conditions, [str(entry) for entry in log]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_network_matches_hard_coded_rules(seed):
+    rng = random.Random(seed)
+    for _ in range(1000):
+        # Sliders near the presence threshold at 5, with an occasional full-range value
+        facts = {s: rng.choice([4, 5]) if rng.random() < 0.7 else rng.randint(0, 10) for s in SYMPTOM_IDS}
+        if rng.random() < 0.9:
+            facts['thoughts_of_harm'] = 0
+        assert network_match(facts) == hard_coded_match(facts)
+
+def test_every_core_subset():
+    # Each condition's core symptoms present in every combination, everything else absent
+    for condition_id, details in CONDITIONS.items():
+        core = details['core_symptoms']
+        for bits in range(1 << len(core)):
+            facts = {s: 0 for s in SYMPTOM_IDS}
+            for position, symptom_id in enumerate(core):
+                if bits >> position & 1:
+                    facts[symptom_id] = 8
+            for symptom_id in details.get('other_symptoms', []):
+                facts[symptom_id] = 8
+            assert network_match(facts) == hard_coded_match(facts), condition_id
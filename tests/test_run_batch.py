@@ -0,0 +1,52 @@
+# tests/test_run_batch.py
+
+import numpy as np
+import pytest
+
+from inference_engine import INTERVENTION_INDEX, RULE_NETWORK, InferenceEngine
+
+SYMPTOM_IDS = RULE_NETWORK.symptom_ids
+INTERVENTION_NAMES = list(INTERVENTION_INDEX.interventions)
+
+
+def looped_run(matrix, history, max_interventions):
+    conditions, interventions = [], []
+    for row in matrix:
+        engine = InferenceEngine(RULE_NETWORK, INTERVENTION_INDEX)
+        for symptom_id, value in zip(SYMPTOM_IDS, row):
+            engine.add_fact(symptom_id, int(value))
+        row_conditions, row_interventions, _ = engine.run(history, max_interventions)
+        conditions.append(row_conditions)
+        interventions.append(row_interventions)
+    return conditions, interventions
+
+def assert_batch_matches_run(matrix, history, max_interventions=3):
+    engine = InferenceEngine(RULE_NETWORK, INTERVENTION_INDEX)
+    batch = engine.run_batch(matrix, history, max_interventions)
+    looped = looped_run(matrix, history, max_interventions)
+    assert batch == looped
+    # Interventions must come back in the same order, not just as the same entries
+    assert [list(row) for row in batch[1]] == [list(row) for row in looped[1]]
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_random_matrices(seed):
+    rng = np.random.default_rng(seed)
+    matrix = rng.integers(0, 11, size=(300, len(SYMPTOM_IDS)))
+    # Keep most rows clear of the safety rule so conditions get ranked
+    matrix[rng.random(len(matrix)) < 0.9, SYMPTOM_IDS.index('thoughts_of_harm')] = 0
+    history = list(rng.choice(INTERVENTION_NAMES, size=int(rng.integers(0, 5)), replace=False))
+    assert_batch_matches_run(matrix, history, int(rng.integers(1, 6)))
+
+@pytest.mark.parametrize('seed', range(4))
+def test_presence_boundary_matrices(seed):
+    rng = np.random.default_rng(100 + seed)
+    # Every slider at 4 or 5, just either side of the presence threshold
+    matrix = rng.integers(4, 6, size=(500, len(SYMPTOM_IDS)))
+    history = list(rng.choice(INTERVENTION_NAMES, size=int(rng.integers(0, 5)), replace=False))
+    assert_batch_matches_run(matrix, history, int(rng.integers(1, 6)))
+
+def test_empty_and_exhausted_history():
+    matrix = np.array([[0] * len(SYMPTOM_IDS), [10] * len(SYMPTOM_IDS)])
+    assert_batch_matches_run(matrix, [])
+    assert_batch_matches_run(matrix, INTERVENTION_NAMES)